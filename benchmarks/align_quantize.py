@@ -0,0 +1,69 @@
+"""对比 fp32 与 int8 动态量化对齐模型的速度和词边界偏移.
+
+    python -m benchmarks.align_quantize /path/to/fixture.mp4
+"""
+import time
+
+import numpy as np
+import typer
+from typing_extensions import Annotated
+from whisperx.audio import SAMPLE_RATE
+
+from tools.transcriber import Transcriber
+
+
+def align_timed(transcriber, result, audio, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        word_segments = []
+        for chunk in transcriber.iter_align(
+            result["segments"], audio, result["language"]
+        ):
+            word_segments.extend(chunk["word_segments"])
+        best = min(best, time.perf_counter() - started)
+    return word_segments, best
+
+
+def boundary_drift(reference, candidate):
+    drift = [
+        abs(ref[key] - cand[key]) * 1000
+        for ref, cand in zip(reference, candidate)
+        for key in ("start", "end")
+        if key in ref and key in cand
+    ]
+    return np.array(drift or [0.0])
+
+
+def main(
+    fixture: Annotated[str, typer.Argument(help="The audio fixture to align")],
+    model: str = "medium",
+    repeat: int = 3,
+):
+    transcriber = Transcriber(model=model)
+    audio = transcriber.load_audio(fixture)
+    result = transcriber.transcribe_audio(audio)
+    duration = len(audio) / SAMPLE_RATE
+
+    # 预热并加载 fp32 模型, 计时不包含模型加载
+    transcriber.get_align_model(result["language"])
+    fp32_words, fp32_seconds = align_timed(transcriber, result, audio, repeat)
+
+    transcriber.align_quantize = True
+    transcriber.align_models.clear()
+    transcriber.get_align_model(result["language"])
+    int8_words, int8_seconds = align_timed(transcriber, result, audio, repeat)
+
+    drift = boundary_drift(fp32_words, int8_words)
+    print(f"fixture: {fixture} ({duration:.1f}s audio, {len(fp32_words)} words)")
+    print(f"fp32: {fp32_seconds:.2f}s (RTF {fp32_seconds / duration:.3f})")
+    print(f"int8: {int8_seconds:.2f}s (RTF {int8_seconds / duration:.3f})")
+    print(f"speedup: {fp32_seconds / int8_seconds:.2f}x")
+    print(
+        f"word boundary drift: mean {drift.mean():.1f}ms, "
+        f"p95 {np.percentile(drift, 95):.1f}ms, max {drift.max():.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,91 @@
+"""测量 fix_common_errors 的单条字幕耗时随词表规模的变化, 并与逐条 re.sub 的旧写法对比.
+
+内置词表下先校验引擎的输出与旧写法完全一致 (包括 " chad " -> "chat gpt" 这类接力替换).
+
+    python -m benchmarks.corrections --cues 20000
+"""
+import random
+import re
+import string
+import time
+
+import typer
+
+from tools.subtitle import CORRECTIONS, CorrectionEngine
+
+
+def legacy_fix(corrections, text):
+    for mistake, correction in corrections.items():
+        text = re.sub(r"\b" + mistake + r"\b", correction, text, flags=re.IGNORECASE)
+    return text
+
+
+def make_glossary(size, rng):
+    glossary = dict(CORRECTIONS)
+    while len(glossary) < size:
+        words = [
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+            for _ in range(rng.randint(1, 2))
+        ]
+        glossary[" ".join(words)] = "".join(words).upper()
+    return glossary
+
+
+def chained_mistakes(glossary):
+    # Whisper 常把 chat 听成 chad, 要先经过 " chad " 规则再命中 "chat gpt" 等规则
+    return [
+        "Chad " + mistake.split(" ", 1)[1]
+        for mistake in glossary
+        if mistake.lower().startswith("chat ")
+    ]
+
+
+def make_cues(count, glossary, rng):
+    vocabulary = ["the", "video", "prompt", "image", "we", "will", "use", "and", "now"]
+    mistakes = list(glossary) + chained_mistakes(glossary)
+    cues = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(6, 16))
+        # 大约每三条字幕出现一个需要纠正的词
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), rng.choice(mistakes).strip())
+        cues.append(" ".join(words) + ".")
+    return cues
+
+
+def per_cue_us(func, cues):
+    started = time.perf_counter()
+    func(cues)
+    return (time.perf_counter() - started) / len(cues) * 1e6
+
+
+def main(cues: int = 20000, legacy_limit: int = 1000):
+    rng = random.Random(0)
+    for size in (len(CORRECTIONS), 100, 1000, 5000, 20000):
+        glossary = make_glossary(size, rng)
+        texts = make_cues(cues, glossary, rng)
+
+        started = time.perf_counter()
+        engine = CorrectionEngine(glossary)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        if glossary == CORRECTIONS:
+            expected = [legacy_fix(glossary, text) for text in texts]
+            assert engine.fix_many(texts) == expected, "engine output differs from legacy_fix"
+
+        engine_us = per_cue_us(engine.fix_many, texts)
+        line = (
+            f"glossary={size:>6}: engine {engine_us:7.2f}us/cue "
+            f"(compile {compile_ms:.0f}ms)"
+        )
+        if size <= legacy_limit:
+            legacy_us = per_cue_us(
+                lambda batch: [legacy_fix(glossary, text) for text in batch],
+                texts[: max(1, cues // 10)],
+            )
+            line += f", legacy {legacy_us:9.2f}us/cue"
+        print(line)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,148 @@
+"""对比逐条 print(flush=True) 的旧写法与 WriteSRT 分块写出的速度, 并校验输出完全一致.
+
+    python -m benchmarks.srt_writer --words 50000
+"""
+import os
+import random
+import re
+import tempfile
+import time
+
+import typer
+
+from tools.transcriber import WriteSRT
+
+
+class LegacyWriteSRT(WriteSRT):
+    """改造前的 WriteSRT: 每条字幕 flush 一次, 高亮时每个词都重建整行"""
+
+    def iterate_result(self, result: dict, options: dict):
+        highlight_words: bool = options["highlight_words"]
+        punctuations = set(".,!?")
+
+        if len(result["segments"]) == 0:
+            return
+
+        def iterate_subtitles():
+            subtitle: list[dict] = []
+            times = []
+
+            for segment in result["segments"]:
+                for i, original_timing in enumerate(segment["words"]):
+                    timing = original_timing.copy()
+
+                    subtitle.append(timing)
+                    times.append(
+                        (segment["start"], segment["end"], segment.get("speaker"))
+                    )
+
+                    if timing["word"][-1] in punctuations:
+                        yield subtitle, times
+                        subtitle = []
+                        times = []
+
+                if len(subtitle) > 0:
+                    yield subtitle, times
+                    subtitle = []
+                    times = []
+
+        for subtitle, times in iterate_subtitles():
+            sstart, ssend, speaker = times[0]
+            subtitle_start = self.format_timestamp(sstart)
+            subtitle_end = self.format_timestamp(ssend)
+            subtitle_text = " ".join([word["word"] for word in subtitle])
+            has_timing = any(["start" in word for word in subtitle])
+
+            prefix = ""
+            if speaker is not None:
+                prefix = f"[{speaker}]: "
+
+            if highlight_words and has_timing:
+                last = subtitle_start
+                all_words = [timing["word"] for timing in subtitle]
+                for i, this_word in enumerate(subtitle):
+                    if "start" in this_word:
+                        start = self.format_timestamp(this_word["start"])
+                        end = self.format_timestamp(this_word["end"])
+                        if last != start:
+                            yield last, start, prefix + subtitle_text
+
+                        yield start, end, prefix + " ".join(
+                            [
+                                (
+                                    re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word)
+                                    if j == i
+                                    else word
+                                )
+                                for j, word in enumerate(all_words)
+                            ]
+                        )
+                        last = end
+            else:
+                yield subtitle_start, subtitle_end, prefix + subtitle_text
+
+    def write_result(self, result, file, options):
+        for i, (start, end, text) in enumerate(
+            self.iterate_result(result, options), start=1
+        ):
+            print(f"{i}\n{start} --> {end}\n{text}\n", file=file, flush=True)
+
+
+def make_transcript(words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["chat", "video", "model", "course", "audio", "prompt", "image"]
+    segments, clock = [], 0.0
+    while words > 0:
+        count = min(words, rng.randint(8, 30))
+        timings = []
+        start = clock
+        for i in range(count):
+            word = rng.choice(vocabulary)
+            if rng.random() < 0.1 or i == count - 1:
+                word += rng.choice(".,!?")
+            timing = {"word": word}
+            # 少量词没有时间戳 (例如数字), 与 whisperx 的对齐结果一致
+            if rng.random() > 0.03:
+                timing.update(start=round(clock, 3), end=round(clock + 0.3, 3))
+            clock += rng.uniform(0.2, 0.5)
+            timings.append(timing)
+        segments.append({"start": round(start, 3), "end": round(clock, 3), "words": timings})
+        clock += rng.uniform(0.0, 2.0)
+        words -= count
+    return {"segments": segments, "language": "en"}
+
+
+def timed_write(writer, result, options, path):
+    started = time.perf_counter()
+    with open(path, "w", encoding="utf-8") as f:
+        writer.write_result(result, file=f, options=options)
+    elapsed = time.perf_counter() - started
+    with open(path, "rb") as f:
+        return elapsed, f.read()
+
+
+def main(words: int = 50000):
+    result = make_transcript(words)
+    with tempfile.TemporaryDirectory() as tmp:
+        for highlight_words in (False, True):
+            options = {
+                "highlight_words": highlight_words,
+                "max_line_count": None,
+                "max_line_width": None,
+            }
+            legacy_seconds, legacy = timed_write(
+                LegacyWriteSRT(tmp), result, options, os.path.join(tmp, "legacy.srt")
+            )
+            fast_seconds, fast = timed_write(
+                WriteSRT(tmp), result, options, os.path.join(tmp, "fast.srt")
+            )
+            assert legacy == fast, "WriteSRT output differs from the legacy writer"
+            print(
+                f"words={words} highlight_words={highlight_words} "
+                f"size={len(fast) / 2**20:.1f}MiB: legacy {legacy_seconds:.3f}s, "
+                f"buffered {fast_seconds:.3f}s ({legacy_seconds / fast_seconds:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
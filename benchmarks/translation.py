@@ -0,0 +1,224 @@
+"""用本地的假 OpenAI 兼容服务测量 translate-subtitle 的吞吐, 不消耗真实的接口额度.
+
+假服务可以设置延迟、出错率和丢编号 (模拟模型合并行) 的概率, 对生成的字幕目录按几种
+分块/去重/并发组合各跑一遍, 输出 cues/sec、calls/cue 和请求延迟的 p50/p99.
+
+    python -m benchmarks.translation --files 20 --cues 300 --latency 0.2 --error-rate 0.02
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+import typer
+
+from tools.track import SubtitleTrack
+from tools.translator import NUMBERED_LINE, Translator
+
+BOILERPLATE = [
+    "Welcome back to the course.",
+    "In this lecture we are going to look at the next step.",
+    "If you have any questions, leave them in the Q&A section.",
+    "See you in the next video.",
+    "Let's get started.",
+]
+VOCABULARY = [
+    "prompt", "image", "model", "video", "we", "will", "use", "the",
+    "style", "and", "now", "click", "generate", "settings", "upscale",
+]
+
+
+class FakeLLM:
+    """假服务的行为参数和请求统计, 由各个处理线程共享"""
+
+    def __init__(self, latency, jitter, error_rate, drop_rate, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+
+    def decide(self):
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.latency * self.jitter))
+            failed = self.random.random() < self.error_rate
+            dropped = self.random.random() < self.drop_rate
+            if failed:
+                self.errors += 1
+            return delay, failed, dropped
+
+    def translate(self, content, dropped):
+        lines = []
+        for line in content.split("\n"):
+            match = NUMBERED_LINE.match(line)
+            if match is not None:
+                lines.append(f"{match.group(1)}. 译文:{match.group(2)}")
+        if dropped and len(lines) > 1:
+            # 模拟模型把两行合成一行, 丢掉一个编号
+            i = self.random.randrange(len(lines) - 1)
+            lines[i] += " " + lines.pop(i + 1).split(". ", 1)[1]
+        return "\n".join(lines)
+
+
+def make_handler(llm):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            delay, failed, dropped = llm.decide()
+            time.sleep(delay)
+            if failed:
+                # 一半按限流返回 429 并带 Retry-After, 一半按服务端错误返回 503
+                if llm.random.random() < 0.5:
+                    self.send_json(
+                        429, {"error": {"message": "rate limited"}}, {"Retry-After": "0.1"}
+                    )
+                else:
+                    self.send_json(503, {"error": {"message": "overloaded"}})
+                return
+            content = llm.translate(request["messages"][-1]["content"], dropped)
+            self.send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{llm.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                },
+            )
+
+    return Handler
+
+
+def make_corpus(path, files, cues, boilerplate_rate, rng):
+    for f in range(files):
+        texts = []
+        for _ in range(cues):
+            if rng.random() < boilerplate_rate:
+                texts.append(rng.choice(BOILERPLATE))
+            else:
+                texts.append(" ".join(rng.choices(VOCABULARY, k=rng.randint(5, 14))) + ".")
+        start = np.arange(cues, dtype=np.int64) * 2500
+        SubtitleTrack(start, start + 2000, texts).write(
+            os.path.join(path, f"lecture-{f:03d}.srt")
+        )
+
+
+class TimedTranslator(Translator):
+    """记录每次请求 (含重试和切换) 的耗时"""
+
+    def __init__(self, *args, **kwargs):
+        self.latencies = []
+        super().__init__(*args, **kwargs)
+
+    def call_service(self, lines):
+        started = time.perf_counter()
+        try:
+            return super().call_service(lines)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def acall_service(self, lines):
+        started = time.perf_counter()
+        try:
+            return await super().acall_service(lines)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+SCENARIOS = {
+    "small-chunks": {"token_budget": 60, "dedup": False, "concurrency": 1},
+    "token-budget": {"token_budget": 1000, "dedup": False, "concurrency": 1},
+    "budget+dedup": {"token_budget": 1000, "dedup": True, "concurrency": 1},
+    "budget+dedup+async": {"token_budget": 1000, "dedup": True, "concurrency": 8},
+}
+
+
+def main(
+    files: int = 10,
+    cues: int = 200,
+    boilerplate_rate: float = 0.3,
+    latency: float = 0.1,
+    jitter: float = 0.3,
+    error_rate: float = 0.0,
+    drop_rate: float = 0.05,
+    rps: float = 1000,
+    scenario: List[str] = typer.Option(list(SCENARIOS)),
+):
+    llm = FakeLLM(latency, jitter, error_rate, drop_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(llm))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = os.path.join(workdir, "input")
+        os.makedirs(input_dir)
+        make_corpus(input_dir, files, cues, boilerplate_rate, random.Random(0))
+        # Translator 从当前目录的 .env 读取服务配置, 让 local 指向假服务
+        with open(os.path.join(workdir, ".env"), "w") as f:
+            f.write(f"LOCAL_BASE_URL=http://127.0.0.1:{server.server_port}/v1/\n")
+            f.write(f"LOCAL_RPS={rps}\n")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for name in scenario:
+                llm.reset()
+                translator = TimedTranslator(
+                    service="local", memory=False, resume=False, **SCENARIOS[name]
+                )
+                # 假服务的 Retry-After 很短, 退避也相应缩短
+                translator.backend.min_wait = 0.05
+                started = time.perf_counter()
+                translator.run(input_dir, os.path.join(workdir, f"output-{name}"))
+                elapsed = time.perf_counter() - started
+                latencies = np.array(translator.latencies or [0.0]) * 1000
+                total = files * cues
+                print(
+                    f"{name:>20}: {total / elapsed:8.1f} cues/s, "
+                    f"{llm.requests / total:.3f} calls/cue "
+                    f"({llm.errors} errors), "
+                    f"p50 {np.percentile(latencies, 50):6.0f}ms, "
+                    f"p99 {np.percentile(latencies, 99):6.0f}ms"
+                )
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,88 @@
+"""对比逐条 AudioSegment += 拼接的旧写法与预分配 NumPy 时间线的合成速度.
+
+旧写法每次 += 都复制整段已拼好的音频, 耗时随长度平方增长, 这里只在前若干条字幕上运行;
+新写法直接跑完整的 2 小时、2000 条字幕.
+
+    python -m benchmarks.tts_timeline --cues 2000 --hours 2
+"""
+import time
+from typing import List
+
+import numpy as np
+import typer
+from pydub import AudioSegment
+
+from tools.track import SubtitleTrack
+from tools.tts import TTSConverter
+
+
+def legacy_contact(track, audios):
+    """改造前 contact_mp3 的拼接部分 (含第一条字幕只补静音的问题)"""
+    sub_audio = AudioSegment.silent(duration=0)
+    durations = track.durations().tolist()
+    gaps = track.gaps().tolist()
+    for i, audio in enumerate(audios):
+        audio_length = len(audio)
+        sub_length = durations[i]
+        if sub_length < audio_length:
+            audio = audio._spawn(
+                audio.raw_data,
+                overrides={"frame_rate": int(audio.frame_rate * audio_length / sub_length)},
+            )
+        if i == 0:
+            sub_audio += AudioSegment.silent(duration=int(track.start[0]) // 1000 * 1000)
+        else:
+            sub_audio += AudioSegment.silent(duration=gaps[i])
+            sub_audio += audio
+    return sub_audio
+
+
+def make_track(cues, hours, rng):
+    # 字幕均匀分布在整段时长内, 每条占间隔的 60%~95%
+    slot = hours * 3_600_000 // cues
+    start = np.arange(cues, dtype=np.int64) * slot + 500
+    end = start + (slot * rng.uniform(0.6, 0.95, cues)).astype(np.int64)
+    return SubtitleTrack(start, end, [f"cue {i}" for i in range(cues)])
+
+
+def make_clips(track, frame_rate, rng):
+    # 语音长度在字幕时长的 0.7~1.3 倍之间, 约三成需要压缩
+    lengths = (track.durations() * rng.uniform(0.7, 1.3, len(track))).astype(np.int64)
+    return [
+        rng.integers(-8000, 8000, length * frame_rate // 1000, dtype=np.int16)
+        for length in lengths.tolist()
+    ]
+
+
+def main(cues: int = 2000, hours: float = 2.0, legacy_cues: List[int] = [100, 200, 400]):
+    rng = np.random.default_rng(0)
+    converter = TTSConverter()
+    frame_rate = converter.frame_rate
+    track = make_track(cues, hours, rng)
+    clips = make_clips(track, frame_rate, rng)
+
+    started = time.perf_counter()
+    timeline = converter.render_timeline(track, clips)
+    elapsed = time.perf_counter() - started
+    print(
+        f"timeline: {cues} cues, {len(timeline) / 3_600_000:.2f}h in {elapsed:.2f}s "
+        f"({elapsed / cues * 1000:.2f}ms/cue)"
+    )
+
+    for count in legacy_cues:
+        prefix = track[:count]
+        audios = [
+            AudioSegment(clip.tobytes(), sample_width=2, frame_rate=frame_rate, channels=1)
+            for clip in clips[:count]
+        ]
+        started = time.perf_counter()
+        legacy = legacy_contact(prefix, audios)
+        elapsed = time.perf_counter() - started
+        print(
+            f"legacy:   {count} cues, {len(legacy) / 3_600_000:.2f}h in {elapsed:.2f}s "
+            f"({elapsed / count * 1000:.2f}ms/cue)"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
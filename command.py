@@ -1,3 +1,5 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import typer
@@ -22,8 +24,13 @@ def reset_path(
     output_dir: Annotated[
         Optional[str], typer.Argument(help="The directory for reset path")
     ] = "/home/amaozhao/Downloads/tt",
+    glossary: Optional[str] = None,
+    workers: int = 1,
+    chunksize: int = 64,
 ):
-    processor = SubtitleProcessor()
+    processor = SubtitleProcessor(
+        glossary=glossary, workers=workers, chunksize=chunksize
+    )
     processor.run(input_dir, output_dir)
 
 
@@ -36,8 +43,26 @@ def translate_path(
         Optional[str], typer.Argument(help="The directory for translate path")
     ] = "/home/amaozhao/Downloads/translation",
     service: str = "local",
+    memory: bool = True,
+    concurrency: int = 1,
+    token_budget: int = 1000,
+    dedup: bool = True,
+    workers: int = 4,
+    resume: bool = True,
+    fallback: Optional[str] = None,
+    retries: int = 4,
 ):
-    translator = Translator(service=service)
+    translator = Translator(
+        service=service,
+        memory=memory,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        dedup=dedup,
+        workers=workers,
+        resume=resume,
+        fallback=fallback,
+        retries=retries,
+    )
     translator.run(input_dir, output_dir)
 
 
@@ -53,8 +78,13 @@ def chain_translate(
         Optional[str], typer.Argument(help="The directory for output path")
     ] = "/home/amaozhao/Downloads/translation",
     service: Annotated[str, typer.Argument()] = "google",
+    glossary: Optional[str] = None,
+    workers: int = 1,
+    chunksize: int = 64,
 ):
-    processor = SubtitleProcessor()
+    processor = SubtitleProcessor(
+        glossary=glossary, workers=workers, chunksize=chunksize
+    )
     processor.run(input_dir, temp_dir)
     translator = Translator(service=service)
     translator.run(temp_dir, output_dir)
@@ -66,8 +96,13 @@ def tts_path(
     output_dir: Annotated[
         Optional[str], typer.Argument(help="The directory for output path")
     ] = "/home/amaozhao/Downloads/tts",
+    concurrency: int = 8,
+    retries: int = 3,
+    memory_limit_mb: int = 256,
 ):
-    tts = TTSConverter()
+    tts = TTSConverter(
+        concurrency=concurrency, retries=retries, memory_limit_mb=memory_limit_mb
+    )
     tts.run(input_dir, output_dir)
 
 
@@ -79,8 +114,36 @@ def transcribe_path(
     model: Annotated[
         Optional[str], typer.Argument(help="The transcribe model type")
     ] = "medium",
+    cache_dir: Optional[str] = None,
+    audio_cache: bool = False,
+    audio_cache_gb: float = 20,
+    workers: int = 1,
+    threads: int = 4,
+    pipeline: bool = True,
+    prefetch: int = 1,
+    result_cache: bool = True,
+    align_cache_size: int = 2,
+    align_cache_mb: Optional[int] = None,
+    align_window: Optional[float] = None,
+    align_int8: bool = False,
+    stream: bool = False,
 ):
-    transcriber = Transcriber(model=model)
+    transcriber = Transcriber(
+        model=model,
+        cache_dir=cache_dir,
+        audio_cache=audio_cache,
+        audio_cache_gb=audio_cache_gb,
+        workers=workers,
+        threads=threads,
+        pipeline=pipeline,
+        prefetch=prefetch,
+        result_cache=result_cache,
+        align_cache_size=align_cache_size,
+        align_cache_mb=align_cache_mb,
+        align_window=align_window,
+        align_quantize=align_int8,
+        stream=stream,
+    )
     transcriber.run(input_path)
 
 
@@ -111,10 +174,30 @@ def chain_all(
     output_dir: Annotated[
         Optional[str], typer.Argument(help="The directory for translate path")
     ] = "/home/amaozhao/Downloads/translation",
+    glossary: Optional[str] = None,
+    stream: bool = False,
 ):
-    transcriber = Transcriber(model=model)
-    transcriber.run(input_path)
-    processor = SubtitleProcessor()
+    processor = SubtitleProcessor(glossary=glossary)
+    if stream:
+        # 每个文件转写完成 (progress 事件 done) 后立即整理字幕, 与后面文件的转写重叠
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            def on_progress(event):
+                srt_paths = [p for p in event["outputs"] if p.endswith(".srt")]
+                if event["done"] and srt_paths:
+                    relative_path = os.path.relpath(srt_paths[0], input_path)
+                    executor.submit(
+                        processor.process_file,
+                        srt_paths[0],
+                        os.path.join(reset_dir, relative_path),
+                    )
+
+            Transcriber(model=model, stream=True, on_progress=on_progress).run(
+                input_path
+            )
+    else:
+        Transcriber(model=model).run(input_path)
+    # 流式模式下已经处理过的文件输出比输入新, 这里只会补上遗漏或失败的文件
     processor.run(input_path, reset_dir)
     translator = Translator(service='deepseek')
     translator.run(reset_dir, output_dir)
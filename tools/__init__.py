@@ -1,11 +1,13 @@
 from .separator import VideoSeparator
 from .subtitle import SubtitleProcessor
+from .track import SubtitleTrack
 from .transcriber import Transcriber
 from .translator import Translator
 from .tts import TTSConverter
 
 __all__ = [
     "SubtitleProcessor",
+    "SubtitleTrack",
     "Transcriber",
     "Translator",
     "TTSConverter",
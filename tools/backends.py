@@ -0,0 +1,153 @@
+import asyncio
+
+import httpx
+from deep_translator import DeeplTranslator, GoogleTranslator
+from openai import AsyncOpenAI, OpenAI
+
+# 内置的 OpenAI 兼容服务; 其它服务只要在 .env 里配置 <NAME>_BASE_URL 即可使用
+OPENAI_DEFAULTS = {
+    "kimi": {"model": "moonshot-v1-8k"},
+    "deepseek": {"model": "deepseek-chat"},
+    "local": {
+        "api_key": "anything",
+        "base_url": "http://localhost:3040/v1/",
+        "model": "gpt-3.5-turbo",
+    },
+}
+
+
+class Backend:
+    """翻译服务: 整个运行期间只创建一次, 复用其中的客户端和连接"""
+
+    model = ""
+    # 能按提示词要求输出编号列表的服务; 机器翻译服务按行对齐
+    structured = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def translate(self, text):
+        raise NotImplementedError
+
+    async def atranslate(self, text):
+        # 没有异步接口的服务放到线程里执行
+        return await asyncio.to_thread(self.translate, text)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class OpenAIBackend(Backend):
+    structured = True
+
+    def __init__(self, name, api_key, base_url, model, prompt, pool_size=10, timeout=60.0):
+        super().__init__(name)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.prompt = prompt
+        self.limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size
+        )
+        self.timeout = timeout
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.Client(limits=self.limits, timeout=timeout),
+            max_retries=0,
+        )
+        # 异步客户端绑定在首次使用它的事件循环上, 用到时再创建
+        self.async_client = None
+
+    def messages(self, text):
+        return [
+            {"role": "user", "content": self.prompt(text)},
+        ]
+
+    def parse(self, response, text):
+        content = response.choices[0].message.content
+        return content.strip() if content else text.strip()
+
+    def translate(self, text):
+        # 出错直接抛出, 由 resilience 层负责重试和切换服务
+        response = self.client.chat.completions.create(
+            messages=self.messages(text),
+            model=self.model,
+        )
+        return self.parse(response, text)
+
+    async def atranslate(self, text):
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout),
+                max_retries=0,
+            )
+        response = await self.async_client.chat.completions.create(
+            messages=self.messages(text),
+            model=self.model,
+        )
+        return self.parse(response, text)
+
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+
+class DeeplBackend(Backend):
+    def __init__(self, api_key):
+        super().__init__("deepl")
+        self.translator = DeeplTranslator(
+            api_key=api_key, source="en", target="zh", use_free_api=True
+        )
+
+    def translate(self, text):
+        return self.translator.translate(text)
+
+
+class GoogleBackend(Backend):
+    def __init__(self):
+        super().__init__("google")
+        self.translator = GoogleTranslator(
+            source="en",
+            target="zh-CN",
+        )
+
+    def translate(self, text):
+        return self.translator.translate(text)
+
+
+def openai_providers(config):
+    providers = set(OPENAI_DEFAULTS)
+    for key in config:
+        if key.endswith("_BASE_URL"):
+            providers.add(key[: -len("_BASE_URL")].lower())
+    return providers
+
+
+def create_backend(name, config, prompt):
+    if name == "deepl":
+        return DeeplBackend(config.get("DEEPL_KEY"))
+    if name == "google":
+        return GoogleBackend()
+    if name in openai_providers(config):
+        prefix = name.upper()
+        defaults = OPENAI_DEFAULTS.get(name, {})
+        return OpenAIBackend(
+            name,
+            api_key=config.get(f"{prefix}_API_KEY") or defaults.get("api_key"),
+            base_url=config.get(f"{prefix}_BASE_URL") or defaults.get("base_url"),
+            model=config.get(f"{prefix}_MODEL") or defaults.get("model"),
+            prompt=prompt,
+            pool_size=int(config.get(f"{prefix}_POOL_SIZE") or 10),
+            timeout=float(config.get(f"{prefix}_TIMEOUT") or 60),
+        )
+    raise ValueError(f"Unknown translation service: {name}")
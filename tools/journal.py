@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+
+
+class ChunkJournal:
+    """翻译日志: 每完成一块就追加一行 JSON, 中断后重跑时从日志恢复已完成的译文.
+
+    每条记录是 [键, 原文, 译文], 键是字幕下标或规范化原文; 恢复时原文对不上的记录会被忽略.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中途退出时最后一行可能只写了一半
+                    continue
+                for key, source, translation in record["entries"]:
+                    entries[key] = (source, translation)
+        return entries
+
+    def append(self, entries):
+        if not entries:
+            return
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps({"entries": entries}, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RunManifest:
+    """记录已经翻译完成的文件, 输入文件的大小和修改时间不变时重跑直接跳过"""
+
+    def __init__(self, path):
+        self.path = path
+        self.finished = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.finished[record["output"]] = record
+
+    @staticmethod
+    def signature(input_file):
+        stat = os.stat(input_file)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def is_finished(self, input_file, output_file):
+        record = self.finished.get(os.path.abspath(output_file))
+        if record is None or not os.path.exists(output_file):
+            return False
+        signature = self.signature(input_file)
+        return record["size"] == signature["size"] and record["mtime"] == signature["mtime"]
+
+    def add(self, input_file, output_file):
+        record = {"output": os.path.abspath(output_file), **self.signature(input_file)}
+        with self.lock:
+            self.finished[record["output"]] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class TranslationMemory:
+    """基于 SQLite 的翻译记忆: 以 服务/模型/提示词版本/规范化原文 为键缓存译文.
+
+    每条记录同时保存当初调用接口的耗时, 命中时累计为节省的时间.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                service TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                latency REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (service, model, prompt_version, source)
+            )
+            """
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split())
+
+    def get(self, service, model, prompt_version, text):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT translation, latency FROM translations "
+                "WHERE service = ? AND model = ? AND prompt_version = ? AND source = ?",
+                (service, model, prompt_version, self.normalize(text)),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_latency += row[1]
+            return row[0]
+
+    def put(self, service, model, prompt_version, text, translation, latency):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    service,
+                    model,
+                    prompt_version,
+                    self.normalize(text),
+                    translation,
+                    latency,
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        return (
+            f"translation memory: {self.hits}/{lookups} hits ({hit_rate:.1f}%), "
+            f"saved {self.saved_latency:.1f}s of API latency"
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
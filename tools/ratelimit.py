@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 个令牌, 最多存 capacity 个.
+
+    reserve 先扣除令牌 (允许透支), 返回需要等待的秒数, 同步和异步调用方共用同一个桶.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """按请求数/秒和 token 数/分钟 两个维度限流, 任一为 None 表示不限"""
+
+    def __init__(self, requests_per_second=None, tokens_per_minute=None):
+        self.buckets = []
+        if requests_per_second:
+            self.requests = TokenBucket(requests_per_second)
+            self.buckets.append((self.requests, lambda tokens: 1))
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+            self.buckets.append((self.tokens, lambda tokens: tokens))
+
+    def reserve(self, tokens=1):
+        return max(
+            [bucket.reserve(cost(tokens)) for bucket, cost in self.buckets], default=0.0
+        )
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+import openai
+import requests
+from deep_translator.exceptions import RequestError, ServerException, TooManyRequests
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from tenacity.wait import wait_base
+
+# 这些状态码说明服务暂时不可用, 稍后重试可能成功
+TRANSIENT_STATUS = {408, 409, 425, 429}
+# 没有状态码的异常只有网络错误和超时才重试; 解析错误、参数错误等重试也没有用
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,  # 包括 APITimeoutError
+    httpx.TransportError,
+    requests.ConnectionError,
+    requests.Timeout,
+    RequestError,
+    TooManyRequests,
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+)
+# deep_translator 的 ServerException 不保留状态码, 只能按错误信息判断
+TRANSIENT_SERVER_ERRORS = {ServerException.errors[status] for status in (429, 500, 503)}
+
+
+class TranslationFailed(Exception):
+    """所有服务都重试失败, 或者熔断后没有可用的备用服务"""
+
+
+def status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_transient(exc):
+    # 有状态码时只重试限流和服务端错误, 其它 4xx 重试也没有用
+    status = status_code(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS or status >= 500
+    if isinstance(exc, ServerException):
+        return bool(exc.args) and exc.args[0] in TRANSIENT_SERVER_ERRORS
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+def retry_after(exc):
+    # 读取响应头里的 Retry-After, 支持秒数和 HTTP 日期两种写法
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class wait_retry_after(wait_base):
+    """优先按服务端给的 Retry-After 等待, 否则使用带抖动的指数退避"""
+
+    def __init__(self, fallback, max_wait):
+        self.fallback = fallback
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state):
+        delay = self.fallback(retry_state)
+        if retry_state.outcome is not None and retry_state.outcome.failed:
+            requested = retry_after(retry_state.outcome.exception())
+            if requested is not None:
+                delay = max(delay, min(requested, self.max_wait))
+        return delay
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断, reset_timeout 秒内不再请求该服务.
+
+    冷却结束后放行请求试探, 成功则恢复, 失败则重新熔断.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        return self.remaining() == 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ResilientService:
+    """按顺序使用主服务和备用服务: 每个服务带重试和熔断, 主服务熔断时直接切到备用服务"""
+
+    def __init__(
+        self,
+        backends,
+        attempts=4,
+        min_wait=1.0,
+        max_wait=60.0,
+        failure_threshold=3,
+        reset_timeout=30.0,
+    ):
+        self.backends = list(backends)
+        self.attempts = attempts
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.breakers = {
+            backend.name: CircuitBreaker(failure_threshold, reset_timeout)
+            for backend in self.backends
+        }
+
+    @property
+    def primary(self):
+        return self.backends[0]
+
+    def retry_options(self):
+        return {
+            "stop": stop_after_attempt(self.attempts),
+            "wait": wait_retry_after(
+                wait_random_exponential(multiplier=self.min_wait, max=self.max_wait),
+                self.max_wait,
+            ),
+            "retry": retry_if_exception(is_transient),
+            "reraise": True,
+        }
+
+    def available(self):
+        return [
+            backend for backend in self.backends if self.breakers[backend.name].allow()
+        ]
+
+    def call(self, request):
+        # request(backend) 发起一次请求, 返回 (实际使用的服务, 结果)
+        error = None
+        for backend in self.available():
+            breaker = self.breakers[backend.name]
+            try:
+                for attempt in Retrying(**self.retry_options()):
+                    with attempt:
+                        result = request(backend)
+            except Exception as e:
+                print(f"翻译出错: {backend.name}: {e}")
+                breaker.record_failure()
+                error = e
+                continue
+            breaker.record_success()
+            return backend, result
+        raise TranslationFailed("all translation services failed") from error
+
+    async def acall(self, request):
+        error = None
+        for backend in self.available():
+            breaker = self.breakers[backend.name]
+            try:
+                async for attempt in AsyncRetrying(**self.retry_options()):
+                    with attempt:
+                        result = await request(backend)
+            except Exception as e:
+                print(f"翻译出错: {backend.name}: {e}")
+                breaker.record_failure()
+                error = e
+                continue
+            breaker.record_success()
+            return backend, result
+        raise TranslationFailed("all translation services failed") from error
+
+    def wait_until_ready(self):
+        # 重试前等到至少有一个服务结束熔断冷却
+        delay = min(self.breakers[backend.name].remaining() for backend in self.backends)
+        if delay:
+            time.sleep(delay)
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
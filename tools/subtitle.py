@@ -1,108 +1,262 @@
+import functools
+import json
+import multiprocessing
 import os
 import re
+import time
 
-import srt
+import numpy as np
+
+from .track import SubtitleTrack
+
+CORRECTIONS = {
+    "DID": "D-ID",
+    "Kyber": "Kaiber",
+    "Kyber AI": "Kaiber AI",
+    "Me Journey": "MidJourney",
+    "MeetJourney": "MidJourney",
+    "Meetjourney": "MidJourney",
+    "cant": "can't",
+    " chad ": " chat ",
+    "chat DPT": "chatGPT",
+    "chat GPD": "chatGPT",
+    "chat LGBT": "chatGPT",
+    "chat dbt": "chatGPT",
+    "chat dvd": "chatGPT",
+    "chat gbd": "chatGPT",
+    "chat gbt": "chatGPT",
+    "chat gpt": "chatGPT",
+    "chat jpg": "chatGPT",
+    "chat jpt": "chatGPT",
+    "chatDPG": "chatGPT",
+    "chatDPT": "chatGPT",
+    "chatgbt": "chatGPT",
+    "doesnt": "doesn't",
+    "meetJourney": "MidJourney",
+    "meetjourney": "MidJourney",
+    "mid journey": "MidJourney",
+    "mid-journey": "MidJourney",
+    "midjourney": "MidJourney",
+    "teh": "the",
+    # 添加更多的纠正, 或者通过 glossary 文件扩展
+}
+FILLER_PATTERN = re.compile(r"\b(um|uh|er|ah)\b", re.IGNORECASE)
+# 整个文件一次替换时用来拼接各条字幕的分隔符 (ASCII record separator)
+RECORD_SEPARATOR = "\x1e"
+SENTENCE_END = set(",;.?!")
+# 纠错最多重复扫描的遍数, 防止规则互相替换时死循环
+MAX_CORRECTION_PASSES = 4
+
+
+def trie_pattern(words):
+    # 把词表构造成前缀树再转成正则, 匹配开销与词表大小基本无关;
+    # 可选分支是贪婪的, 因此总是优先匹配最长的词
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(node[char]) for char in sorted(node) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+
+class CorrectionEngine:
+    """把所有 错误->纠正 规则编译成一个不区分大小写的正则, 每遍扫描完成全部替换"""
+
+    def __init__(self, corrections):
+        self.corrections = {k.lower(): v for k, v in corrections.items()}
+        self.pattern = None
+        if self.corrections:
+            self.pattern = re.compile(
+                r"\b(?:" + trie_pattern(self.corrections) + r")\b", re.IGNORECASE
+            )
+
+    @staticmethod
+    def load_glossary(path):
+        # 每行一条 "错误<TAB>纠正", # 开头为注释; 不做 strip, 以便保留首尾空格
+        corrections = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line or line.startswith("#") or "\t" not in line:
+                    continue
+                mistake, correction = line.split("\t", 1)
+                corrections[mistake] = correction
+        return corrections
+
+    def replace(self, match):
+        text = match.group(0)
+        return self.corrections.get(text.lower(), text)
+
+    def fix(self, text):
+        if self.pattern is None:
+            return text
+        # 规则之间可以接力 (" chad " 先变成 " chat ", 再命中 "chat gpt"), 与逐条 re.sub 的
+        # 旧写法一致; 重复扫描直到文本不再变化
+        for _ in range(MAX_CORRECTION_PASSES):
+            fixed = self.pattern.sub(self.replace, text)
+            if fixed == text:
+                break
+            text = fixed
+        return text
+
+    def fix_many(self, texts):
+        # 整个文件拼成一个字符串只扫描一遍, 再按分隔符拆回各条字幕
+        if not texts:
+            return []
+        return self.fix(RECORD_SEPARATOR.join(texts)).split(RECORD_SEPARATOR)
+
+
+@functools.lru_cache(maxsize=None)
+def get_correction_engine(glossary=None):
+    # 每个进程 (每个 glossary) 只编译一次
+    corrections = dict(CORRECTIONS)
+    if glossary:
+        corrections.update(CorrectionEngine.load_glossary(glossary))
+    return CorrectionEngine(corrections)
 
 
 class SubtitleProcessor:
+    def __init__(self, glossary=None, workers=1, chunksize=64):
+        self.glossary = glossary
+        self.workers = max(1, workers)
+        self.chunksize = chunksize
+
+    @property
+    def corrections(self):
+        return get_correction_engine(self.glossary)
 
     def remove_filler_words(self, text):
-        filler_words = ["um", "uh", "er", "ah"]
-        pattern = r"\b(" + r"|".join(filler_words) + r")\b"
-        return re.sub(pattern, "", text, flags=re.IGNORECASE)
+        return FILLER_PATTERN.sub("", text)
 
     def fix_common_errors(self, text):
-        corrections = {
-            "DID": "D-ID",
-            "Kyber": "Kaiber",
-            "Kyber AI": "Kaiber AI",
-            "Me Journey": "MidJourney",
-            "MeetJourney": "MidJourney",
-            "Meetjourney": "MidJourney",
-            "cant": "can't",
-            " chad ": " chat ",
-            "chat DPT": "chatGPT",
-            "chat GPD": "chatGPT",
-            "chat LGBT": "chatGPT",
-            "chat dbt": "chatGPT",
-            "chat dvd": "chatGPT",
-            "chat gbd": "chatGPT",
-            "chat gbt": "chatGPT",
-            "chat gpt": "chatGPT",
-            "chat jpg": "chatGPT",
-            "chat jpt": "chatGPT",
-            "chatDPG": "chatGPT",
-            "chatDPT": "chatGPT",
-            "chatgbt": "chatGPT",
-            "doesnt": "doesn't",
-            "meetJourney": "MidJourney",
-            "meetjourney": "MidJourney",
-            "mid journey": "MidJourney",
-            "mid-journey": "MidJourney",
-            "midjourney": "MidJourney",
-            "teh": "the",
-            # 添加更多的纠正
-        }
-        for mistake, correction in corrections.items():
-            text = re.sub(
-                r"\b" + mistake + r"\b", correction, text, flags=re.IGNORECASE
-            )
-        return text
+        return self.corrections.fix(text)
 
-    def is_complete_sentence(self, text):
-        text = text.strip()
-        if re.search(r"[,;.?!]$", text):
-            return True
-        return False
-
-    def merge_subtitles(self, subtitles):
-        sub_list = []
-        processed_subs = []
-        result_sub = []
-        for sub in subtitles:
-            if sub.content in (".", ",", "?"):
-                continue
-            if sub_list:
-                sub_list.append(sub)
-                check_sentence = " ".join([s.content for s in sub_list])
-                if self.is_complete_sentence(check_sentence):
-                    processed_subs.append(sub_list)
-                    sub_list = []
-            else:
-                if self.is_complete_sentence(sub.content):
-                    processed_subs.append([sub])
-                else:
-                    sub_list.append(sub)
-
-        for idx, s_l in enumerate(processed_subs):
-            text = " ".join([_.content for _ in s_l])
-            text = self.fix_common_errors(text)
-            text = self.remove_filler_words(text)
-            new_sub = srt.Subtitle(
-                index=idx + 1, start=s_l[0].start, end=s_l[-1].end, content=text
-            )
-            result_sub.append(new_sub)
-        return result_sub
+    def split_sentences(self, track):
+        # 返回 (合并后的整句, 最后一个句末之后凑不成一句的剩余片段)
+        # 去掉只有标点的片段
+        track = track[np.array([c not in (".", ",", "?") for c in track.content], dtype=bool)]
+        # 片段去掉空白后以句末标点结尾即为一句结束; 空白片段不会结束句子
+        ends = np.flatnonzero([c.strip()[-1:] in SENTENCE_END for c in track.content])
+        if not len(ends):
+            return SubtitleTrack.empty(), track
+        firsts = np.concatenate(([0], ends[:-1] + 1))
+        texts = self.corrections.fix_many(
+            [
+                " ".join(track.content[first: last + 1])
+                for first, last in zip(firsts.tolist(), ends.tolist())
+            ]
+        )
+        merged = SubtitleTrack(
+            track.start[firsts],
+            track.end[ends],
+            [self.remove_filler_words(text) for text in texts],
+        )
+        return merged, track[int(ends[-1]) + 1:]
 
-    def run(self, input_dir, output_dir):
-        # 创建输出根目录(如果不存在)
-        os.makedirs(output_dir, exist_ok=True)
+    def merge_subtitles(self, track):
+        # 最后一个句末之后的片段凑不成一句, 与原来一样丢弃
+        return self.split_sentences(track)[0]
+
+    def iter_merged(self, tracks):
+        # 逐段合并: 上一段末尾没说完的片段并入下一段开头, 结果与整体 merge_subtitles 一致
+        rest = SubtitleTrack.empty()
+        for track in tracks:
+            merged, rest = self.split_sentences(SubtitleTrack.concat([rest, track]))
+            if len(merged):
+                yield merged
 
+    @staticmethod
+    def is_transcribing(input_path):
+        # Transcriber 流式输出时在字幕旁写 .progress.json, 完成前 done 为 false
+        progress_path = f"{os.path.splitext(input_path)[0]}.progress.json"
+        try:
+            with open(progress_path, encoding="utf-8") as f:
+                return not json.load(f)["done"]
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def collect_tasks(self, input_dir, output_dir):
+        tasks, skipped = [], 0
         for root, _, files in os.walk(input_dir):
             for file in files:
                 if file.endswith(".srt"):
                     input_path = os.path.join(root, file)
-                    subs = srt.parse(open(input_path, encoding="utf-8").read())
-                    processed_subs = self.merge_subtitles(subs)
-
                     # 构建输出文件路径,保持与输入目录结构一致
                     relative_path = os.path.relpath(input_path, input_dir)
                     output_path = os.path.join(output_dir, relative_path)
-                    output_dir_path = os.path.dirname(output_path)
-                    os.makedirs(output_dir_path, exist_ok=True)
+                    # 流式转写还没写完的字幕先跳过, 下次运行再处理
+                    if self.is_transcribing(input_path):
+                        skipped += 1
+                        continue
+                    # 输出比输入新, 说明已经处理过
+                    if (
+                        os.path.exists(output_path)
+                        and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+                    ):
+                        skipped += 1
+                        continue
+                    tasks.append((input_path, output_path))
+        return tasks, skipped
+
+    def process_file(self, input_path, output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # 先写临时文件再替换, 中途失败不会留下"比输入新"的半成品
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        # 分段解析、合并并写出, 内存占用不随字幕文件大小增长
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            index = 1
+            for merged in self.iter_merged(SubtitleTrack.iter_read(input_path)):
+                merged = merged.cleaned()
+                f.write(merged.compose(index))
+                index += len(merged)
+        os.replace(tmp_path, output_path)
+        return input_path
+
+    def run(self, input_dir, output_dir):
+        # 创建输出根目录(如果不存在)
+        os.makedirs(output_dir, exist_ok=True)
+        started = time.perf_counter()
+        tasks, skipped = self.collect_tasks(input_dir, output_dir)
+
+        if self.workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(
+                self.workers, initializer=_init_worker, initargs=(self.glossary,)
+            ) as pool:
+                for _ in pool.imap_unordered(
+                    _process_worker, tasks, chunksize=self.chunksize
+                ):
+                    pass
+        else:
+            for input_path, output_path in tasks:
+                self.process_file(input_path, output_path)
+
+        elapsed = time.perf_counter() - started
+        rate = len(tasks) / elapsed if elapsed else 0.0
+        print(
+            f">>Processed {len(tasks)} files ({skipped} up to date) "
+            f"in {elapsed:.1f}s with {self.workers} workers: {rate:.1f} files/sec"
+        )
+
+
+_worker = None
+
+
+def _init_worker(glossary):
+    global _worker
+    _worker = SubtitleProcessor(glossary=glossary)
+
 
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        f.write(srt.compose(processed_subs))
+def _process_worker(task):
+    return _worker.process_file(*task)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+import itertools
+import re
+
+import numpy as np
+
+BLOCK_SPLIT = re.compile(r"\n[ \t\r]*\n")
+TIMING_PATTERN = re.compile(
+    r"(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)"
+)
+MULTI_NEWLINE = re.compile(r"\n\n+")
+# 首尾的空白行; 只去掉整行, 保留最后一条字幕文本末尾的空格, 与其它字幕一致
+EDGE_BLANK_LINES = re.compile(r"^(?:[ \t\r]*\n)+|(?:\n[ \t\r]*)+$")
+MS_FACTORS = np.array([3_600_000, 60_000, 1_000, 1], dtype=np.int64)
+
+
+def format_timestamps(milliseconds, decimal_marker=","):
+    """把毫秒数组格式化成 HH:MM:SS,mmm 字符串列表, SubtitleTrack 和 WriteSRT 共用"""
+    hours, milliseconds = np.divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = np.divmod(milliseconds, 60_000)
+    seconds, milliseconds = np.divmod(milliseconds, 1_000)
+    if len(hours) and hours.max() >= 100:
+        # 小时超过两位时字符串不再定长, 逐条格式化
+        return [
+            f"{h:02d}:{m:02d}:{s:02d}{decimal_marker}{ms:03d}"
+            for h, m, s, ms in zip(
+                hours.tolist(), minutes.tolist(), seconds.tolist(), milliseconds.tolist()
+            )
+        ]
+    # HH:MM:SS,mmm 共 12 个字符, 拼成数字矩阵后一次解码
+    width = 12
+    digits = np.stack(
+        [
+            hours // 10, hours % 10,
+            minutes // 10, minutes % 10,
+            seconds // 10, seconds % 10,
+            milliseconds // 100, milliseconds // 10 % 10, milliseconds % 10,
+        ],
+        axis=1,
+    )
+    chars = np.empty((len(digits), width), dtype=np.uint8)
+    chars[:, [0, 1, 3, 4, 6, 7, 9, 10, 11]] = digits + ord("0")
+    chars[:, [2, 5]] = ord(":")
+    chars[:, 8] = ord(decimal_marker)
+    text = chars.tobytes().decode("ascii")
+    return [text[i: i + width] for i in range(0, len(text), width)]
+
+
+class SubtitleTrack:
+    """列式字幕轨: 起止时间是毫秒 int64 数组, 文本放在字符串表里.
+
+    各工具之间共用这一种表示, 合并、间隔计算和时间线摆放都可以直接做数组运算,
+    不再逐条处理 srt.Subtitle 和 timedelta.
+    """
+
+    def __init__(self, start, end, content):
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.content = list(content)
+
+    def __len__(self):
+        return len(self.content)
+
+    def __getitem__(self, index):
+        # 支持切片、下标数组和布尔掩码, 返回新的 SubtitleTrack
+        if isinstance(index, slice):
+            content = self.content[index]
+        else:
+            positions = np.arange(len(self))[index]
+            content = [self.content[i] for i in positions.tolist()]
+        return SubtitleTrack(self.start[index], self.end[index], content)
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [])
+
+    @classmethod
+    def parse(cls, text):
+        text = text.lstrip("\ufeff").replace("\r\n", "\n")
+        # 空文件 (或只有 BOM / 空白) 是合法的空字幕
+        if not text.strip():
+            return cls.empty()
+        timings, content = [], []
+        for block in BLOCK_SPLIT.split(EDGE_BLANK_LINES.sub("", text)):
+            lines = block.strip("\n").split("\n")
+            # 序号行可以缺省, 以时间行为准
+            offset = 0 if "-->" in lines[0] else 1
+            match = TIMING_PATTERN.search(lines[offset]) if len(lines) > offset else None
+            if match is None:
+                # 文本中间夹了空行: 和 srt.parse 一样并入上一条字幕
+                if not content:
+                    raise ValueError(f"Invalid SRT block: {block!r}")
+                content[-1] += "\n" + block
+                continue
+            timings.append(match.groups())
+            content.append("\n".join(lines[offset + 1:]))
+        if not timings:
+            return cls.empty()
+        # 一次性把所有时间字段转成整数并换算为毫秒
+        fields = np.array(timings, dtype=np.int64).reshape(-1, 2, 4)
+        milliseconds = fields @ MS_FACTORS
+        return cls(milliseconds[:, 0], milliseconds[:, 1], content)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def iter_read(cls, path, size=4096):
+        # 逐行读取, 每攒够 size 条字幕解析成一段 SubtitleTrack, 内存占用与文件大小无关;
+        # 只在新字幕 (带时间行) 开始处切分, 文本中间的空行仍然并入上一条
+        with open(path, encoding="utf-8") as f:
+            blocks, block, cues = [], [], 0
+            # 末尾补一个空行, 让最后一块和其它块走同样的收尾逻辑
+            for line in itertools.chain(f, ["\n"]):
+                if line.strip():
+                    block.append(line)
+                    continue
+                if not block:
+                    continue
+                # 与 parse 相同的判断: 序号行可以缺省, 以时间行为准
+                offset = 0 if "-->" in block[0] else 1
+                starts_cue = (
+                    len(block) > offset and TIMING_PATTERN.search(block[offset]) is not None
+                )
+                if starts_cue and cues >= size:
+                    yield cls.parse("\n".join(blocks))
+                    blocks, cues = [], 0
+                blocks.append("".join(block))
+                cues += starts_cue
+                block = []
+            if blocks:
+                yield cls.parse("\n".join(blocks))
+
+    @classmethod
+    def concat(cls, tracks):
+        tracks = list(tracks)
+        if not tracks:
+            return cls.empty()
+        return cls(
+            np.concatenate([track.start for track in tracks]),
+            np.concatenate([track.end for track in tracks]),
+            [text for track in tracks for text in track.content],
+        )
+
+    def with_content(self, content):
+        return SubtitleTrack(self.start, self.end, content)
+
+    def durations(self):
+        return self.end - self.start
+
+    def gaps(self):
+        # 每条字幕之前的空白时长, 第一条从 0 开始算
+        previous_end = np.concatenate(([0], self.end[:-1]))
+        return self.start - previous_end
+
+    def cleaned(self):
+        # 与 srt.compose 一致: 按时间排序, 跳过空文本、负起点和起点不早于终点的字幕,
+        # 并把文本中的空行合并掉
+        order = np.lexsort((self.end, self.start))
+        content = [
+            MULTI_NEWLINE.sub("\n", self.content[i].strip("\n")) for i in order.tolist()
+        ]
+        has_content = np.array([bool(c.strip()) for c in content], dtype=bool)
+        start, end = self.start[order], self.end[order]
+        keep = has_content & (start >= 0) & (start < end)
+        texts = [c for c, k in zip(content, keep.tolist()) if k]
+        return SubtitleTrack(start[keep], end[keep], texts)
+
+    def compose(self, start_index=1):
+        # 编号从 start_index 开始, 分段写出时各段编号可以接续
+        track = self.cleaned()
+        if not len(track):
+            return ""
+        count = len(track)
+        stamps = format_timestamps(np.concatenate((track.start, track.end)))
+        return "".join(
+            f"{i}\n{s} --> {e}\n{text}\n\n"
+            for i, s, e, text in zip(
+                range(start_index, start_index + count),
+                stamps[:count],
+                stamps[count:],
+                track.content,
+            )
+        )
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.compose())
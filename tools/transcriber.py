@@ -1,14 +1,22 @@
 import gc
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import queue
 import re
+import threading
+import time
 import warnings
+from collections import OrderedDict
 from typing import TextIO
 
 import numpy as np
 import torch
 from whisperx.alignment import align, load_align_model
 from whisperx.asr import load_model
-from whisperx.audio import load_audio
+from whisperx.audio import SAMPLE_RATE, load_audio
 from whisperx.utils import (
     LANGUAGES,
     LANGUAGES_WITHOUT_SPACES,
@@ -17,13 +25,21 @@ from whisperx.utils import (
     get_writer,
 )
 
+from .track import format_timestamps
+
+# output_format="all" 时流式写出的格式, 与 whisperx.utils.get_writer("all") 一致
+STREAM_FORMATS = ["txt", "vtt", "srt", "tsv", "json"]
+
 
 class WriteSRT(SubtitlesWriter):
     extension: str = "srt"
     always_include_hours: bool = True
     decimal_marker: str = ","
+    # 每攒够这么多条字幕格式化并写出一次
+    block_size: int = 4096
 
-    def iterate_result(self, result: dict, options: dict):
+    def iterate_cues(self, result: dict, options: dict):
+        # 与 iterate_result 相同的断句逻辑, 但时间保持为秒, 由调用方批量格式化
         # raw_max_line_width: Optional[int] = options["max_line_width"]
         # max_line_count: Optional[int] = options["max_line_count"]
         highlight_words: bool = options["highlight_words"]
@@ -39,16 +55,14 @@ class WriteSRT(SubtitlesWriter):
             times = []
 
             for segment in result["segments"]:
-                for i, original_timing in enumerate(segment["words"]):
-                    timing = original_timing.copy()
-
-                    subtitle.append(timing)
+                for original_timing in segment["words"]:
+                    subtitle.append(original_timing)
                     times.append(
                         (segment["start"], segment["end"], segment.get("speaker"))
                     )
 
                     # 如果当前单词是标点符号,则断句
-                    if timing["word"][-1] in punctuations:
+                    if original_timing["word"][-1] in punctuations:
                         yield subtitle, times
                         subtitle = []
                         times = []
@@ -59,58 +73,192 @@ class WriteSRT(SubtitlesWriter):
                     subtitle = []
                     times = []
 
+        def underline(word):
+            # 等价于 re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word); 含换行时正则不匹配, 原样保留
+            if "\n" in word:
+                return re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word)
+            body = word.lstrip()
+            return f"{word[: len(word) - len(body)]}<u>{body}</u>"
+
+        def to_ms(seconds):
+            # 与 format_timestamp 相同的取整, 用于比较格式化后是否相同
+            return round(seconds * 1000.0)
+
         if "words" in result["segments"][0]:
+            separator = "" if result["language"] in LANGUAGES_WITHOUT_SPACES else " "
             for subtitle, times in iterate_subtitles():
                 sstart, ssend, speaker = times[0]
-                subtitle_start = self.format_timestamp(sstart)
-                subtitle_end = self.format_timestamp(ssend)
-                if result["language"] in LANGUAGES_WITHOUT_SPACES:
-                    subtitle_text = "".join([word["word"] for word in subtitle])
-                else:
-                    subtitle_text = " ".join([word["word"] for word in subtitle])
-                has_timing = any(["start" in word for word in subtitle])
+                all_words = [word["word"] for word in subtitle]
+                subtitle_text = separator.join(all_words)
+                has_timing = any("start" in word for word in subtitle)
 
                 prefix = ""
                 if speaker is not None:
                     prefix = f"[{speaker}]: "
 
                 if highlight_words and has_timing:
-                    last = subtitle_start
-                    all_words = [timing["word"] for timing in subtitle]
+                    last = sstart
                     for i, this_word in enumerate(subtitle):
                         if "start" in this_word:
-                            start = self.format_timestamp(this_word["start"])
-                            end = self.format_timestamp(this_word["end"])
-                            if last != start:
+                            start, end = this_word["start"], this_word["end"]
+                            if to_ms(last) != to_ms(start):
                                 yield last, start, prefix + subtitle_text
 
+                            # 每个词只做一次下划线替换, 其余部分直接切片拼接
+                            underlined = underline(all_words[i])
                             yield start, end, prefix + " ".join(
-                                [
-                                    (
-                                        re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word)
-                                        if j == i
-                                        else word
-                                    )
-                                    for j, word in enumerate(all_words)
-                                ]
+                                [*all_words[:i], underlined, *all_words[i + 1:]]
                             )
                             last = end
                 else:
-                    yield subtitle_start, subtitle_end, prefix + subtitle_text
+                    yield sstart, ssend, prefix + subtitle_text
         else:
             for segment in result["segments"]:
-                segment_start = self.format_timestamp(segment["start"])
-                segment_end = self.format_timestamp(segment["end"])
                 segment_text = segment["text"].strip().replace("-->", "->")
                 if "speaker" in segment:
                     segment_text = f"[{segment['speaker']}]: {segment_text}"
-                yield segment_start, segment_end, segment_text
+                yield segment["start"], segment["end"], segment_text
+
+    def format_timestamps(self, seconds: list) -> list:
+        # format_timestamp 的向量化版本, 定长格式交给 track.format_timestamps 批量处理
+        milliseconds = np.round(np.asarray(seconds, dtype=np.float64) * 1000.0)
+        milliseconds = milliseconds.astype(np.int64)
+        assert (milliseconds >= 0).all(), "non-negative timestamp expected"
+        if not self.always_include_hours:
+            # 变长格式走逐条格式化
+            return [self.format_timestamp(ms / 1000.0) for ms in milliseconds.tolist()]
+        return format_timestamps(milliseconds, self.decimal_marker)
+
+    def iterate_blocks(self, result: dict, options: dict):
+        cues = []
+        for cue in self.iterate_cues(result, options):
+            cues.append(cue)
+            if len(cues) >= self.block_size:
+                yield cues
+                cues = []
+        if cues:
+            yield cues
+
+    def iterate_result(self, result: dict, options: dict):
+        for cues in self.iterate_blocks(result, options):
+            starts, ends, texts = zip(*cues)
+            stamps = self.format_timestamps(starts + ends)
+            yield from zip(stamps[: len(cues)], stamps[len(cues):], texts)
 
     def write_result(self, result: dict, file: TextIO, options: dict):
-        for i, (start, end, text) in enumerate(
-            self.iterate_result(result, options), start=1
-        ):
-            print(f"{i}\n{start} --> {end}\n{text}\n", file=file, flush=True)
+        # 按块格式化时间戳并整块写出, 不再逐条 flush
+        index = 1
+        for cues in self.iterate_blocks(result, options):
+            starts, ends, texts = zip(*cues)
+            stamps = self.format_timestamps(starts + ends)
+            file.write(
+                "".join(
+                    f"{i}\n{start} --> {end}\n{text}\n\n"
+                    for i, start, end, text in zip(
+                        range(index, index + len(cues)),
+                        stamps[: len(cues)],
+                        stamps[len(cues):],
+                        texts,
+                    )
+                )
+            )
+            index += len(cues)
+
+
+class StreamingWriter:
+    """边对齐边写字幕: 每追加一批片段, 就用与非流式相同的 whisperx writer 重写整个输出文件.
+
+    写临时文件后原子替换, 文件任何时刻都是完整合法的, 内容与非流式运行的结果一致.
+    """
+
+    def __init__(
+        self, audio_path, output_format, options, duration, language, on_progress=None
+    ):
+        output_dir = os.path.dirname(audio_path)
+        formats = STREAM_FORMATS if output_format == "all" else [output_format]
+        self.writers = [get_writer(fmt, output_dir) for fmt in formats]
+        basename = os.path.splitext(os.path.basename(audio_path))[0]
+        self.paths = [
+            os.path.join(output_dir, f"{basename}.{writer.extension}")
+            for writer in self.writers
+        ]
+        self.progress_path = os.path.join(output_dir, f"{basename}.progress.json")
+        self.audio_path = audio_path
+        self.options = options
+        self.duration = duration
+        self.on_progress = on_progress
+        self.result = {"segments": [], "word_segments": [], "language": language}
+        self.chunks = 0
+
+    def append(self, result):
+        self.result["segments"].extend(result["segments"])
+        self.result["word_segments"].extend(result.get("word_segments", []))
+        self.chunks += 1
+        self.flush()
+        aligned_until = result["segments"][-1]["end"] if result["segments"] else 0.0
+        self.publish(aligned_until, done=False)
+
+    def close(self):
+        if not self.chunks:
+            self.flush()
+        self.publish(self.duration, done=True)
+
+    def flush(self):
+        for writer, path in zip(self.writers, self.paths):
+            buffer = io.StringIO()
+            writer.write_result(self.result, buffer, self.options)
+            self.write(path, buffer.getvalue())
+
+    def publish(self, aligned_until, done):
+        # 进度事件同时写入 .progress.json; SubtitleProcessor 据此跳过还没写完的字幕,
+        # chain-all 通过 on_progress 在每个文件完成后立即开始后续处理
+        event = {
+            "file": self.audio_path,
+            "outputs": self.paths,
+            "segments": len(self.result["segments"]),
+            "aligned_until": aligned_until,
+            "duration": self.duration,
+            "done": done,
+        }
+        self.write(self.progress_path, json.dumps(event))
+        if self.on_progress is not None:
+            self.on_progress(event)
+
+    @staticmethod
+    def write(path, content):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class ResultCache:
+    """按内容寻址的 JSON 结果缓存, 键由各阶段的全部输入计算得到"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def key(self, **inputs):
+        payload = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, default=float)
+        os.replace(tmp_path, path)
 
 
 class Transcriber:
@@ -159,7 +307,23 @@ class Transcriber:
         threads=4,
         hf_token=None,
         print_progress=False,
+        cache_dir=None,
+        audio_cache=False,
+        audio_cache_gb=20,
+        workers=1,
+        pipeline=True,
+        prefetch=1,
+        result_cache=True,
+        align_cache_size=2,
+        align_cache_mb=None,
+        align_window=None,
+        align_quantize=False,
+        stream=False,
+        stream_window=300,
+        on_progress=None,
     ):
+        # 保存构造参数, 多进程模式下每个 worker 用它重建 Transcriber
+        self.init_kwargs = {k: v for k, v in locals().items() if k != "self"}
         self.model = model
         self.model_dir = model_dir
         self.device = "cpu"
@@ -171,7 +335,7 @@ class Transcriber:
         self.output_format = output_format
         self.compute_type = compute_type
         # alignment params
-        self.align_model = align_model
+        self.align_model_name = align_model
         self.interpolate_method = interpolate_method
         self.no_align = no_align
         self.return_char_alignments = return_char_alignments
@@ -204,6 +368,31 @@ class Transcriber:
         self.threads = threads
         self.hf_token = hf_token
         self.print_progress = print_progress
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.expanduser("~"), ".cache", "ai-videos"
+        )
+        # 解码后的音频默认在文件处理完后删除; 开启 audio_cache 时保留, 总大小受 audio_cache_gb 限制
+        self.audio_cache = audio_cache
+        self.audio_cache_gb = audio_cache_gb
+        self.workers = max(1, workers)
+        self.pipeline = pipeline
+        self.prefetch = max(1, prefetch)
+        self.result_cache = ResultCache(os.path.join(self.cache_dir, "results"))
+        self.use_result_cache = result_cache
+        # 按语言缓存的对齐模型 (LRU), 首次用到时才加载
+        self.align_models = OrderedDict()
+        self.align_cache_size = max(1, align_cache_size)
+        self.align_cache_mb = align_cache_mb
+        # 分窗对齐: 每个窗口最多覆盖多少秒的片段, None 表示整段对齐
+        self.align_window = align_window
+        # CPU 上对 wav2vec2 的 Linear 层做 int8 动态量化
+        self.align_quantize = align_quantize
+        # 流式输出: 按窗口对齐, 每个窗口完成后立即更新字幕文件并发布进度
+        self.stream = stream
+        if stream and not self.align_window:
+            self.align_window = stream_window
+        self.on_progress = on_progress
+        self.streams = {}
         # model_flush: bool = args.pop("model_flush")
         if task == "translate":
             # translation cannot be aligned
@@ -235,8 +424,8 @@ class Transcriber:
         if (threads := self.threads) > 0:
             torch.set_num_threads(self.threads)
             self.faster_whisper_threads = self.threads
-        self.transcribe_model = self.get_model()
-        self.align_model, self.align_metadata = self.get_align_model()
+        # 多进程模式下模型由各个 worker 进程自行加载
+        self.transcribe_model = self.get_model() if self.workers == 1 else None
         # self.writer = get_writer(self.output_format, self.output_dir)
 
     def get_asr_options(self):
@@ -269,71 +458,261 @@ class Transcriber:
         )
         return model
 
-    def get_align_model(self):
+    def get_align_model(self, language):
+        if language in self.align_models:
+            self.align_models.move_to_end(language)
+            return self.align_models[language]
+        # 指定的 align_model 只适用于默认语言, 其它语言使用 whisperx 的默认模型
         align_model, align_metadata = load_align_model(
-            self.align_language,
+            language,
             self.device,
-            model_name=self.align_model
+            model_name=self.align_model_name if language == self.align_language else None,
         )
+        if self.align_quantize:
+            align_model = torch.quantization.quantize_dynamic(
+                align_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.align_models[language] = (align_model, align_metadata)
+        self.evict_align_models()
         return align_model, align_metadata
 
-    def transcription(self, file):
-        # Part 1: VAD & ASR Loop
-        results = []
-        audio = load_audio(file)
-        # >> VAD & ASR
-        print(">>Performing transcription...")
-        result = self.transcribe_model.transcribe(
-            audio,
-            batch_size=self.batch_size,
+    def evict_align_models(self):
+        # 按数量和内存上限淘汰最久未用的模型, 刚加载的模型始终保留
+        def size_mb(model):
+            tensors = list(model.parameters()) + list(model.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors) / 2**20
+
+        while len(self.align_models) > 1:
+            over_count = len(self.align_models) > self.align_cache_size
+            over_memory = self.align_cache_mb is not None and (
+                sum(size_mb(model) for model, _ in self.align_models.values())
+                > self.align_cache_mb
+            )
+            if not (over_count or over_memory):
+                break
+            language, _ = self.align_models.popitem(last=False)
+            print(f">>Unloading alignment model for '{language}'")
+            gc.collect()
+
+    def audio_cache_path(self, file):
+        stat = os.stat(file)
+        key = hashlib.sha1(
+            f"{os.path.abspath(file)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+        return os.path.join(self.cache_dir, "audio", f"{key}.npy")
+
+    def load_audio(self, file):
+        # 解码后的 16kHz 音频写成 .npy, 以内存映射方式读取, 同一文件的各阶段不再重复调用 ffmpeg
+        cache_path = self.audio_cache_path(file)
+        if os.path.exists(cache_path):
+            # 更新修改时间, 清理缓存时按最近使用排序
+            os.utime(cache_path)
+        else:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, load_audio(file))
+            os.replace(tmp_path, cache_path)
+            if self.audio_cache:
+                self.trim_audio_cache(keep=cache_path)
+        # copy-on-write 映射: 可写但不会改动缓存文件, torch.from_numpy 也不会告警
+        return np.load(cache_path, mmap_mode="c")
+
+    def release_audio(self, file):
+        # 未开启 audio_cache 时, 文件处理完就删除它的 .npy
+        if self.audio_cache:
+            return
+        try:
+            os.remove(self.audio_cache_path(file))
+        except FileNotFoundError:
+            pass
+
+    def trim_audio_cache(self, keep=None):
+        # 总大小超过 audio_cache_gb 时, 按最近使用时间从旧到新删除
+        root = os.path.join(self.cache_dir, "audio")
+        entries = []
+        for name in os.listdir(root):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        limit = self.audio_cache_gb * 1024 ** 3
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def asr_cache_key(self, audio_hash):
+        return self.result_cache.key(
+            stage="asr",
+            audio=audio_hash,
+            model=self.model,
+            compute_type=self.compute_type,
+            asr_options=self.get_asr_options(),
+            vad_options={"vad_onset": self.vad_onset, "vad_offset": self.vad_offset},
             chunk_size=self.chunk_size,
-            print_progress=self.print_progress,
+            language=self.language,
+            task=self.task,
         )
-        results.append((result, file))
 
-        # Unload Whisper and VAD
-        # del model
-        gc.collect()
-        torch.cuda.empty_cache()
-        return results
+    def transcribe_audio(self, audio):
+        audio_hash = hashlib.sha1(memoryview(audio)).hexdigest()
+        key = self.asr_cache_key(audio_hash)
+        cached = self.result_cache.get(key) if self.use_result_cache else None
+        if cached is not None:
+            print(">>Using cached transcription...")
+            result = {"segments": cached["segments"], "language": cached["language"]}
+        else:
+            # >> VAD & ASR
+            print(">>Performing transcription...")
+            result = self.transcribe_model.transcribe(
+                audio,
+                batch_size=self.batch_size,
+                chunk_size=self.chunk_size,
+                print_progress=self.print_progress,
+            )
+            # 每个 ASR 片段对应一个合并后的 VAD 片段, 起止时间即 VAD 边界
+            if self.use_result_cache:
+                self.result_cache.put(
+                    key,
+                    {
+                        "vad_segments": [
+                            {"start": seg["start"], "end": seg["end"]}
+                            for seg in result["segments"]
+                        ],
+                        "segments": result["segments"],
+                        "language": result["language"],
+                    },
+                )
+            # Unload Whisper and VAD
+            # del model
+            gc.collect()
+            torch.cuda.empty_cache()
+        result["audio_hash"] = audio_hash
+        return result
+
+    def transcription(self, file):
+        # Part 1: VAD & ASR Loop
+        audio = self.load_audio(file)
+        return [(self.transcribe_audio(audio), file, audio)]
+
+    def align_windows(self, segments):
+        if not self.align_window:
+            return [segments]
+        windows = []
+        for segment in segments:
+            if windows and segment["end"] - windows[-1][0]["start"] <= self.align_window:
+                windows[-1].append(segment)
+            else:
+                windows.append([segment])
+        return windows
+
+    def iter_align(self, segments, audio, language):
+        # 分窗时每个窗口只从内存映射中切出对应的一段音频交给 align,
+        # 再把词级时间平移回全局时间轴, 峰值内存与音频总时长无关
+        align_model, align_metadata = self.get_align_model(language)
+        for window in self.align_windows(segments):
+            offset = stop = 0
+            if self.align_window:
+                # 两端各留 1 秒余量, 避免切断片段边界
+                offset = max(0, int(window[0]["start"] * SAMPLE_RATE) - SAMPLE_RATE)
+                stop = int(window[-1]["end"] * SAMPLE_RATE) + SAMPLE_RATE
+            offset_seconds = offset / SAMPLE_RATE
+            chunk = align(
+                [
+                    {
+                        **segment,
+                        "start": segment["start"] - offset_seconds,
+                        "end": segment["end"] - offset_seconds,
+                    }
+                    for segment in window
+                ],
+                align_model,
+                align_metadata,
+                np.array(audio[offset:stop]) if self.align_window else audio,
+                self.device,
+                interpolate_method=self.interpolate_method,
+                return_char_alignments=self.return_char_alignments,
+                print_progress=self.print_progress,
+            )
+            # word_segments 与 segments 中的 words 是同一批 dict, 只平移 segments,
+            # 再从平移后的 words 重建 word_segments, 避免词级时间被平移两次
+            if offset:
+                shift_timings(chunk["segments"], offset_seconds)
+            chunk["word_segments"] = [
+                word for segment in chunk["segments"] for word in segment.get("words", [])
+            ]
+            check_word_timings(chunk["segments"])
+            yield chunk
 
     def align(self, results):
         # Part 2: Align Loop
+        if self.no_align:
+            return results
         align_result = []
-        if not self.no_align:
-            for result, audio_path in results:
-                # >> Align
-                if len(results) > 1:
-                    input_audio = audio_path
+        for result, audio_path, input_audio in results:
+            # >> Align
+            if input_audio is None:
+                # 单独重跑对齐时从缓存读取, 不再解码
+                input_audio = self.load_audio(audio_path)
+
+            if len(result["segments"]) > 0:
+                language = result.get("language", self.align_language)
+                # 结果来自外部 (没有音频指纹) 时不走缓存
+                audio_hash = result.get("audio_hash")
+                cacheable = self.use_result_cache and audio_hash is not None
+                key = self.result_cache.key(
+                    stage="align",
+                    # 分窗对齐曾把词级时间平移两次, 递增版本使旧缓存失效
+                    version=2,
+                    audio=audio_hash,
+                    segments=result["segments"],
+                    language=language,
+                    align_model=self.align_model_name,
+                    interpolate_method=self.interpolate_method,
+                    return_char_alignments=self.return_char_alignments,
+                    align_window=self.align_window,
+                    align_quantize=self.align_quantize,
+                )
+                cached = self.result_cache.get(key) if cacheable else None
+                if cached is not None:
+                    print(">>Using cached alignment...")
+                    result = cached
                 else:
-                    # lazily load audio from part 1
-                    input_audio = load_audio(audio_path)
-
-                if self.align_model is not None and len(result["segments"]) > 0:
-                    if result.get("language", "en") != self.align_metadata["language"]:
-                        # load new language
-                        self.align_model, self.align_metadata = load_align_model(
-                            result["language"], self.device
-                        )
                     print(">>Performing alignment...")
-                    result = align(
-                        result["segments"],
-                        self.align_model,
-                        self.align_metadata,
-                        input_audio,
-                        self.device,
-                        interpolate_method=self.interpolate_method,
-                        return_char_alignments=self.return_char_alignments,
-                        print_progress=self.print_progress,
-                    )
-
-                align_result.append((result, audio_path))
-                # Unload align model
-                gc.collect()
-                torch.cuda.empty_cache()
+                    stream = self.open_stream(audio_path, input_audio)
+                    if stream is not None:
+                        self.streams[audio_path] = stream
+                    aligned = {"segments": [], "word_segments": []}
+                    for chunk in self.iter_align(
+                        result["segments"], input_audio, language
+                    ):
+                        aligned["segments"].extend(chunk["segments"])
+                        aligned["word_segments"].extend(chunk["word_segments"])
+                        if stream is not None:
+                            stream.append(chunk)
+                    result = aligned
+                    if cacheable:
+                        self.result_cache.put(key, result)
+
+            align_result.append((result, audio_path, input_audio))
+            # Unload align model
+            gc.collect()
+            torch.cuda.empty_cache()
         return align_result
 
-    def save(self, results):
+    def writer_options(self):
         word_options = ["highlight_words", "max_line_count", "max_line_width"]
         if self.no_align:
             for option in word_options:
@@ -341,18 +720,197 @@ class Transcriber:
                     raise Exception(f"--{option} not possible with --no_align")
         if self.max_line_count and not self.max_line_width:
             warnings.warn("--max_line_count has no effect without --max_line_width")
-        writer_args = {arg: getattr(self, arg) for arg in word_options}
+        return {arg: getattr(self, arg) for arg in word_options}
+
+    def open_stream(self, audio_path, audio):
+        if not self.stream:
+            return None
+        return StreamingWriter(
+            audio_path,
+            self.output_format,
+            self.writer_options(),
+            len(audio) / SAMPLE_RATE,
+            self.align_language,
+            on_progress=self.on_progress,
+        )
+
+    def save(self, results):
+        writer_args = self.writer_options()
 
         # >> Write
-        for result, audio_path in results:
+        for result, audio_path, audio in results:
+            if self.stream:
+                # 对齐时已经逐块写出; 命中缓存或未对齐的结果在这里一次写完
+                stream = self.streams.pop(audio_path, None)
+                if stream is None:
+                    stream = self.open_stream(audio_path, audio)
+                    stream.append(result)
+                stream.close()
+                continue
             writer = get_writer(self.output_format, os.path.dirname(audio_path))
             # writer = WriteSRT(os.path.dirname(audio_path))
             result["language"] = self.align_language
             writer(result, audio_path, writer_args)
 
+    def collect_files(self, input_dir):
+        files = []
+        for root, _, names in os.walk(input_dir):
+            for name in names:
+                if name.endswith(".mp4"):
+                    files.append(os.path.join(root, name))
+        return files
+
+    def transcribe_file(self, file):
+        started = time.perf_counter()
+        results = self.align(self.transcription(file))
+        self.save(results)
+        self.release_audio(file)
+        duration = len(results[0][2]) / SAMPLE_RATE if results else 0.0
+        return file, duration, time.perf_counter() - started
+
+    def run_pool(self, files):
+        # 线程在 worker 之间平分, 避免 torch / faster-whisper 线程超订
+        total_threads = self.threads if self.threads > 0 else os.cpu_count()
+        kwargs = {
+            **self.init_kwargs,
+            "workers": 1,
+            "threads": max(1, total_threads // self.workers),
+            # 回调不能跨进程传递, worker 只写 .progress.json
+            "on_progress": None,
+        }
+        # 大文件优先, 减少最后只剩一个 worker 在跑的长尾
+        files = sorted(files, key=os.path.getsize, reverse=True)
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(
+            self.workers, initializer=_init_worker, initargs=(kwargs,)
+        ) as pool:
+            yield from pool.imap_unordered(_transcribe_worker, files)
+
+    def run_pipeline(self, files):
+        # 解码 -> ASR -> 对齐/写入 三个阶段各占一个线程, 通过有界队列衔接:
+        # 当前文件做 ASR 时, 下一个文件在后台解码, 上一个文件在对齐和写入,
+        # 同时驻留的音频数量受队列深度限制
+        def decode(file):
+            started = time.perf_counter()
+            audio = self.load_audio(file)
+            return file, audio, time.perf_counter() - started
+
+        def transcribe(item):
+            file, audio, seconds = item
+            started = time.perf_counter()
+            result = self.transcribe_audio(audio)
+            return [(result, file, audio)], seconds + time.perf_counter() - started
+
+        def align_and_save(item):
+            results, seconds = item
+            _, file, audio = results[0]
+            started = time.perf_counter()
+            self.save(self.align(results))
+            self.release_audio(file)
+            seconds += time.perf_counter() - started
+            return file, len(audio) / SAMPLE_RATE, seconds
+
+        files_queue = queue.Queue()
+        for file in files:
+            files_queue.put(file)
+        files_queue.put(_DONE)
+        decoded = queue.Queue(maxsize=self.prefetch)
+        transcribed = queue.Queue(maxsize=1)
+        done = queue.Queue()
+        errors = []
+        stages = [
+            threading.Thread(
+                target=_run_stage, args=(func, inbox, outbox, errors), daemon=True
+            )
+            for func, inbox, outbox in (
+                (decode, files_queue, decoded),
+                (transcribe, decoded, transcribed),
+                (align_and_save, transcribed, done),
+            )
+        ]
+        for stage in stages:
+            stage.start()
+        while (stat := done.get()) is not _DONE:
+            yield stat
+        for stage in stages:
+            stage.join()
+        if errors:
+            raise errors[0]
+
+    def report(self, stats, elapsed):
+        audio_seconds = sum(duration for _, duration, _ in stats)
+        busy_seconds = sum(seconds for _, _, seconds in stats)
+        files_per_hour = len(stats) / elapsed * 3600 if elapsed else 0.0
+        rtf = elapsed / audio_seconds if audio_seconds else 0.0
+        worker_rtf = busy_seconds / audio_seconds if audio_seconds else 0.0
+        print(
+            f">>Transcribed {len(stats)} files ({audio_seconds / 3600:.2f}h audio) "
+            f"in {elapsed:.1f}s with {self.workers} workers / {self.threads} threads: "
+            f"{files_per_hour:.1f} files/hour, RTF {rtf:.3f} "
+            f"(per-worker RTF {worker_rtf:.3f})"
+        )
+
     def run(self, input_dir):
-        for root, _, files in os.walk(input_dir):
-            for audio in files:
-                if audio.endswith(".mp4"):
-                    results = self.align(self.transcription(os.path.join(root, audio)))
-                    self.save(results)
+        files = self.collect_files(input_dir)
+        started = time.perf_counter()
+        if self.workers > 1:
+            iterator = self.run_pool(files)
+        elif self.pipeline and len(files) > 1:
+            iterator = self.run_pipeline(files)
+        else:
+            iterator = map(self.transcribe_file, files)
+        stats = []
+        for file, duration, seconds in iterator:
+            stats.append((file, duration, seconds))
+            print(f">>Done {file}: {duration:.0f}s audio in {seconds:.1f}s")
+        self.report(stats, time.perf_counter() - started)
+
+
+def shift_timings(items, offset):
+    for item in items:
+        for key in ("start", "end"):
+            if key in item:
+                item[key] = round(item[key] + offset, 3)
+        shift_timings(item.get("words", []), offset)
+        shift_timings(item.get("chars", []), offset)
+
+
+def check_word_timings(segments, tolerance=0.01):
+    # 对齐后每个词的时间必须落在所属片段内, 否则说明时间轴平移出错, 不能写入缓存和字幕
+    for segment in segments:
+        for word in segment.get("words", []):
+            if "start" not in word or "end" not in word:
+                continue
+            if (
+                word["start"] < segment["start"] - tolerance
+                or word["end"] > segment["end"] + tolerance
+            ):
+                raise ValueError(
+                    f"Word {word.get('word')!r} at {word['start']}-{word['end']}s "
+                    f"is outside its segment {segment['start']}-{segment['end']}s"
+                )
+
+
+_DONE = object()
+_worker = None
+
+
+def _run_stage(func, inbox, outbox, errors):
+    while (item := inbox.get()) is not _DONE:
+        if errors:
+            # 任一阶段出错后只排空队列, 保证上游线程不会阻塞在 put 上
+            continue
+        try:
+            outbox.put(func(item))
+        except Exception as e:
+            errors.append(e)
+    outbox.put(_DONE)
+
+
+def _init_worker(kwargs):
+    global _worker
+    _worker = Transcriber(**kwargs)
+
+
+def _transcribe_worker(file):
+    return _worker.transcribe_file(file)
@@ -1,29 +1,115 @@
+import asyncio
 import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import srt
-from deep_translator import DeeplTranslator, GoogleTranslator
 from dotenv import dotenv_values
-from openai import OpenAI
+
+from .backends import create_backend
+from .journal import ChunkJournal, RunManifest
+from .memory import TranslationMemory
+from .ratelimit import RateLimiter
+from .resilience import ResilientService, TranslationFailed
+from .track import SubtitleTrack
+
+# 修改 get_prompt 后需要递增, 使翻译记忆中旧提示词的译文失效
+PROMPT_VERSION = 2
+# 各服务默认的限流 (请求数/秒), 可在 .env 中用 <SERVICE>_RPS / <SERVICE>_TPM 覆盖
+DEFAULT_RPS = {"local": 2}
+JOURNAL_SUFFIX = ".journal.jsonl"
+CORPUS_JOURNAL = ".translate-corpus.journal.jsonl"
+MANIFEST_NAME = ".translate-manifest.jsonl"
+# 模型返回的编号行, 兼容 "1." "1、" "1)" "1:" 等写法
+NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.、．:：)）]\s*(.*)$")
 
 
 class Translator:
-    def __init__(self, service=None):
+    def __init__(
+        self,
+        service=None,
+        memory=True,
+        concurrency=1,
+        token_budget=1000,
+        dedup=True,
+        workers=4,
+        resume=True,
+        fallback=None,
+        retries=4,
+        retry_passes=1,
+    ):
         self.config = dotenv_values(".env")
         self.dl_key = self.config.get("DEEPL_KEY")
         self.service = service or "kimi"
-        self.chunk_size = 5
-        self.delimiter = "||"
+        # 每次请求的原文 token 预算, chunk_size 为每块的最多条数
+        self.token_budget = token_budget
+        self.chunk_size = 50
+        self.calls = 0
+        # 整个目录去重后统一翻译, workers 为写回文件的线程数
+        self.dedup = dedup
+        self.workers = max(1, workers)
+        # 记录每块译文和已完成的文件, 中断后重跑从断点继续
+        self.resume = resume
+        self.manifest = None
+        self.cues = 0
+        # 大于 1 时用 asyncio 并发翻译各个分块, 速率由 limiter 控制
+        self.concurrency = max(1, concurrency)
+        self.limiter = self.get_limiter()
+        # 服务对象整个运行期间复用, 保持 HTTP 长连接; 主服务熔断时切换到 fallback
+        backends = [create_backend(self.service, self.config, self.get_prompt)]
+        if fallback and fallback != self.service:
+            backends.append(create_backend(fallback, self.config, self.get_prompt))
+        self.backend = ResilientService(backends, attempts=retries)
+        # 失败的字幕放进重试队列, 本轮结束后再重试 retry_passes 次
+        self.retry_passes = retry_passes
+        # 异步模式下所有文件共用一个事件循环, 异步连接池才能跨文件复用
+        self.loop = None
+        self.memory = None
+        if memory:
+            self.memory = TranslationMemory(
+                self.config.get("TRANSLATION_MEMORY")
+                or os.path.join(
+                    os.path.expanduser("~"), ".cache", "ai-videos", "translations.sqlite3"
+                )
+            )
 
-    def run(self, input_dir, output_dir):
+    def collect_files(self, input_dir, output_dir):
+        tasks = []
         for root, _, filenames in os.walk(input_dir):
             rel_path = os.path.relpath(root, input_dir)
             output_path = os.path.join(output_dir, rel_path)
             os.makedirs(output_path, exist_ok=True)
             for filename in filenames:
                 if filename.endswith(".srt"):
-                    self.translate_file(root, output_path, filename)
-                    time.sleep(1)
+                    tasks.append((root, output_path, filename))
+        return tasks
+
+    def run(self, input_dir, output_dir):
+        tasks = self.collect_files(input_dir, output_dir)
+        self.manifest = None
+        if self.resume:
+            self.manifest = RunManifest(os.path.join(output_dir, MANIFEST_NAME))
+        if self.dedup:
+            self.translate_corpus(tasks, output_dir)
+        else:
+            for task in tasks:
+                self.translate_file(*task)
+        print(self.report())
+        if self.memory is not None:
+            print(self.memory.report())
+        self.close()
+
+    def run_async(self, coroutine):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def close(self):
+        self.backend.close()
+        if self.loop is not None:
+            self.loop.run_until_complete(self.backend.aclose())
+            self.loop.close()
+            self.loop = None
 
     def replace(self, content):
         if not content:
@@ -31,73 +117,369 @@ class Translator:
         content = content.replace("您", "你")
         return content
 
-    def chunk_subs(self, subs):
-        chunked_subs = [
-            subs[i: i + self.chunk_size] for i in range(0, len(subs), self.chunk_size)
+    def cue_tokens(self, content):
+        # 粗略估计: 约 3 个字符 1 个 token, 另加编号和换行的开销
+        return len(content) // 3 + 2
+
+    def chunk_lines(self, lines):
+        # 按 token 预算贪心切块: 累计到预算或条数上限就开始新的一块, 返回各块的区间
+        bounds = []
+        begin, used = 0, 0
+        for i, content in enumerate(lines):
+            cost = self.cue_tokens(content)
+            if i > begin and (
+                used + cost > self.token_budget or i - begin >= self.chunk_size
+            ):
+                bounds.append((begin, i))
+                begin, used = i, 0
+            used += cost
+        if begin < len(lines):
+            bounds.append((begin, len(lines)))
+        return bounds
+
+    def chunk_subs(self, track):
+        return [track[begin:end] for begin, end in self.chunk_lines(track.content)]
+
+    def format_chunk(self, chunks, translations):
+        # 返回每条字幕的 "译文\n原文"
+        contents = []
+        for content, t in zip(chunks.content, translations):
+            t = self.replace(t.split("\n")[0].strip())
+            contents.append(t + "\n" + content)
+        return contents
+
+    def encode_batch(self, lines, structured=True):
+        # 字幕内的换行压成空格, 保证一行对应一条字幕
+        lines = [" ".join(line.split()) for line in lines]
+        if structured:
+            return "\n".join(f"{i}. {line}" for i, line in enumerate(lines, 1))
+        return "\n".join(lines)
+
+    def decode_batch(self, response, count, structured=True):
+        # 校验返回的条数和编号, 对不上时返回 None 由调用方二分重试
+        lines = [line for line in (response or "").split("\n") if line.strip()]
+        if not structured:
+            return [line.strip() for line in lines] if len(lines) == count else None
+        numbered = {}
+        for line in lines:
+            match = NUMBERED_LINE.match(line)
+            if match is None:
+                continue
+            number = int(match.group(1))
+            if number in numbered:
+                return None
+            numbered[number] = match.group(2).strip()
+        if sorted(numbered) == list(range(1, count + 1)):
+            return [numbered[i] for i in range(1, count + 1)]
+        if count == 1 and lines:
+            # 单条字幕时模型常常省略编号, 直接采用整段译文
+            return [lines[0].strip()]
+        return None
+
+    def split_cached(self, lines):
+        # 逐条查翻译记忆, 返回已有译文和需要调用接口的下标; 空行不翻译
+        translations = [
+            "" if not line.strip() else self.lookup(line) for line in lines
         ]
-        return chunked_subs
+        missing = [i for i, t in enumerate(translations) if t is None]
+        return translations, missing
+
+    def translate_lines(self, lines):
+        translations, missing = self.split_cached(lines)
+        if missing:
+            results = self.translate_batch([lines[i] for i in missing])
+            for i, t in zip(missing, results):
+                translations[i] = t
+        return translations
+
+    async def atranslate_lines(self, lines):
+        translations, missing = self.split_cached(lines)
+        if missing:
+            results = await self.atranslate_batch([lines[i] for i in missing])
+            for i, t in zip(missing, results):
+                translations[i] = t
+        return translations
+
+    def translate_batch(self, lines):
+        self.limiter.acquire(self.estimate_tokens(self.encode_batch(lines)))
+        started = time.perf_counter()
+        try:
+            backend, response = self.call_service(lines)
+        except TranslationFailed:
+            # 不把原文当作译文写出, 返回 None 交给重试队列
+            return [None] * len(lines)
+        self.calls += 1
+        translations = self.decode_batch(response, len(lines), backend.structured)
+        if translations is None:
+            if len(lines) == 1:
+                # 单行也解析不出译文, 不再拆分, 交给重试队列
+                return [None]
+            # 条数对不上: 拆成两半分别重译, 而不是整块逐条重发
+            middle = len(lines) // 2
+            return self.translate_batch(lines[:middle]) + self.translate_batch(
+                lines[middle:]
+            )
+        self.remember_batch(backend, lines, translations, time.perf_counter() - started)
+        return translations
+
+    async def atranslate_batch(self, lines):
+        await self.limiter.acquire_async(self.estimate_tokens(self.encode_batch(lines)))
+        started = time.perf_counter()
+        try:
+            backend, response = await self.acall_service(lines)
+        except TranslationFailed:
+            return [None] * len(lines)
+        self.calls += 1
+        translations = self.decode_batch(response, len(lines), backend.structured)
+        if translations is None:
+            if len(lines) == 1:
+                return [None]
+            middle = len(lines) // 2
+            halves = await asyncio.gather(
+                self.atranslate_batch(lines[:middle]),
+                self.atranslate_batch(lines[middle:]),
+            )
+            return halves[0] + halves[1]
+        self.remember_batch(backend, lines, translations, time.perf_counter() - started)
+        return translations
+
+    def translate_batches(self, batches, on_done=None):
+        # 结果按提交顺序返回, 并发只影响速度不影响顺序; 每块完成后回调 on_done 记日志
+        if self.concurrency > 1:
+            return self.run_async(self.atranslate_batches(batches, on_done))
+        results = []
+        for index, lines in enumerate(batches):
+            results.append(self.translate_lines(lines))
+            if on_done is not None:
+                on_done(index, results[-1])
+        return results
+
+    async def atranslate_batches(self, batches, on_done=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def translate(index, lines):
+            async with semaphore:
+                translations = await self.atranslate_lines(lines)
+            if on_done is not None:
+                on_done(index, translations)
+            return translations
+
+        return await asyncio.gather(
+            *(translate(index, lines) for index, lines in enumerate(batches))
+        )
+
+    def open_journal(self, path):
+        return ChunkJournal(path) if self.resume else None
+
+    def translate_pending(self, keys, sources, translations, journal):
+        # 翻译 translations 中还没有译文的键; 失败的字幕进入重试队列, 本轮结束后再重试.
+        # 返回重试后仍然失败的键
+        for retry in range(self.retry_passes + 1):
+            pending = [key for key in keys if translations.get(key) is None]
+            if not pending:
+                break
+            if retry:
+                print(f"retry pass {retry}: {len(pending)} cues")
+                self.backend.wait_until_ready()
+            batches = [
+                pending[begin:end]
+                for begin, end in self.chunk_lines([sources[key] for key in pending])
+            ]
+
+            def on_done(index, results, batches=batches):
+                entries = []
+                for key, t in zip(batches[index], results):
+                    translations[key] = t
+                    if t is not None:
+                        entries.append([key, sources[key], t])
+                if journal is not None:
+                    journal.append(entries)
+
+            self.translate_batches(
+                [[sources[key] for key in batch] for batch in batches], on_done
+            )
+        return [key for key in keys if translations.get(key) is None]
 
     def translate_file(self, dirpath, output_path, filename):
         input_file = os.path.join(dirpath, filename)
         output_file = os.path.join(output_path, filename)
+        if self.manifest is not None and self.manifest.is_finished(input_file, output_file):
+            print(f"skip finished: {input_file}")
+            return
 
-        with open(input_file, "r", encoding="utf-8") as f:
-            subs = list(srt.parse(f.read()))
+        track = SubtitleTrack.read(input_file)
         print(f"start translate: {input_file}")
+        self.cues += len(track)
 
-        chunk_subs = self.chunk_subs(subs)
-
-        output_subs = []
-
-        for ch_idx, chunks in enumerate(chunk_subs):
-            joined_chunks = self.delimiter.join([c.content for c in chunks])
-            translated_chunks = self.translate_text(joined_chunks)
-            translations = translated_chunks.split(self.delimiter)
-            if len(chunks) != len(translations):
-                for t in chunks:
-                    _translated = self.translate_text(t.content) or ''
-                    _translated = _translated.split('\n')[0]
-                    _translated = self.replace(_translated.strip())
-                    if not _translated:
-                        continue
-                    new_sub = srt.Subtitle(
-                        index=t.index,
-                        start=t.start,
-                        end=t.end,
-                        content=_translated + "\n" + t.content,
-                    )
-                    output_subs.append(new_sub)
-            else:
-                for idx, t in enumerate(translations):
-                    t = t.split('\n')[0]
-                    t = self.replace(t)
-                    new_sub = srt.Subtitle(
-                        index=subs[idx + ch_idx * self.chunk_size].index,
-                        start=subs[idx + ch_idx * self.chunk_size].start,
-                        end=subs[idx + ch_idx * self.chunk_size].end,
-                        content=t.strip() + "\n" + subs[idx + ch_idx * self.chunk_size].content,
-                    )
-                    output_subs.append(new_sub)
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(srt.compose(output_subs))
-
-    def translate_text(self, text):
-        if self.service == "kimi":
-            return self.kimi_translate(text)
-        if self.service == "local":
-            return self.local_translate(text)
-        if self.service == "deepseek":
-            return self.deepseek_translate(text)
-        if self.service == "deepl":
-            return DeeplTranslator(
-                api_key=self.dl_key, source="en", target="zh", use_free_api=True
-            ).translate(text)
-        if self.service == "google":
-            return GoogleTranslator(
-                source="en",
-                target="zh-CN",
-            ).translate(text)
+        # 从日志恢复上次已经完成的字幕, 只翻译剩下的部分
+        journal = self.open_journal(output_file + JOURNAL_SUFFIX)
+        done = journal.load() if journal is not None else {}
+        sources = dict(enumerate(track.content))
+        translations = {
+            i: done[i][1]
+            for i, content in sources.items()
+            if i in done and done[i][0] == content
+        }
+        if translations:
+            print(f"resume: {len(translations)}/{len(track)} cues from journal")
+
+        try:
+            failed = self.translate_pending(list(sources), sources, translations, journal)
+        finally:
+            if journal is not None:
+                journal.close()
+        if failed:
+            # 不写出不完整的文件, 保留日志, 下次运行只重试失败的字幕
+            print(f"{len(failed)} cues failed, rerun to resume: {input_file}")
+            return
+        self.write_translated(
+            track, [translations[i] for i in range(len(track))], output_file
+        )
+        self.finish_file(input_file, output_file, journal)
+
+    def finish_file(self, input_file, output_file, journal=None):
+        if journal is not None:
+            journal.remove()
+        if self.manifest is not None:
+            self.manifest.add(input_file, output_file)
+
+    def write_translated(self, track, translations, output_file):
+        track.with_content(self.format_chunk(track, translations)).write(output_file)
+
+    def translate_corpus(self, tasks, output_dir):
+        # 先汇总整个目录的字幕, 相同的规范化文本只翻译一次, 再把译文分发回各个文件
+        if self.manifest is not None:
+            finished = [
+                task
+                for task in tasks
+                if self.manifest.is_finished(
+                    os.path.join(task[0], task[2]), os.path.join(task[1], task[2])
+                )
+            ]
+            if finished:
+                print(f"skip finished: {len(finished)} files")
+            tasks = [task for task in tasks if task not in finished]
+        if not tasks:
+            return
+        tracks = [
+            SubtitleTrack.read(os.path.join(dirpath, filename))
+            for dirpath, _, filename in tasks
+        ]
+        keys = [
+            [TranslationMemory.normalize(content) for content in track.content]
+            for track in tracks
+        ]
+        unique = list(dict.fromkeys(key for file_keys in keys for key in file_keys if key))
+        total = sum(len(track) for track in tracks)
+        self.cues += total
+        print(f"start translate: {len(tasks)} files, {len(unique)} unique cues")
+
+        # 整个目录共用一个日志, 以规范化原文为键
+        journal = self.open_journal(os.path.join(output_dir, CORPUS_JOURNAL))
+        done = journal.load() if journal is not None else {}
+        translations = {key: done[key][1] for key in unique if key in done}
+        translations[""] = ""
+        if len(translations) > 1:
+            print(f"resume: {len(translations) - 1}/{len(unique)} unique cues from journal")
+
+        try:
+            failed = set(
+                self.translate_pending(
+                    unique, {key: key for key in unique}, translations, journal
+                )
+            )
+        finally:
+            if journal is not None:
+                journal.close()
+
+        def write_file(task, track, file_keys):
+            dirpath, output_path, filename = task
+            if failed.intersection(file_keys):
+                print(f"cues failed, rerun to resume: {os.path.join(dirpath, filename)}")
+                return
+            output_file = os.path.join(output_path, filename)
+            self.write_translated(
+                track, [translations[key] for key in file_keys], output_file
+            )
+            if self.manifest is not None:
+                self.manifest.add(os.path.join(dirpath, filename), output_file)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(write_file, task, track, file_keys)
+                for task, track, file_keys in zip(tasks, tracks, keys)
+            ]
+            for future in futures:
+                future.result()
+        if journal is not None and not failed:
+            journal.remove()
+
+        # 与逐个文件分块翻译相比省下的请求数; 两边都按全部非空字幕计算,
+        # 从日志恢复的部分不算作去重的收益
+        per_file = sum(
+            len(self.chunk_lines([key for key in file_keys if key])) for file_keys in keys
+        )
+        chunks = len(self.chunk_lines(unique))
+        ratio = total / len(unique) if unique else 0.0
+        print(
+            f"dedup: {total} cues -> {len(unique)} unique ({ratio:.2f}x), "
+            f"{per_file - chunks} API calls avoided"
+        )
+
+    def report(self):
+        calls_per_cue = self.calls / self.cues if self.cues else 0.0
+        return (
+            f"translation: {self.calls} API calls for {self.cues} cues "
+            f"({calls_per_cue:.3f} calls/cue)"
+        )
+
+    def model_name(self):
+        return self.backend.primary.model
+
+    def get_limiter(self):
+        service = self.service.upper()
+        rps = self.config.get(f"{service}_RPS") or DEFAULT_RPS.get(self.service, 1)
+        tpm = self.config.get(f"{service}_TPM")
+        return RateLimiter(
+            requests_per_second=float(rps),
+            tokens_per_minute=float(tpm) if tpm else None,
+        )
+
+    def estimate_tokens(self, text):
+        # 粗略估计: 提示词+原文+译文, 约 3 个字符 1 个 token
+        return (len(self.get_prompt(text)) + len(text)) // 3 + 1
+
+    def lookup(self, text):
+        if self.memory is None:
+            return None
+        return self.memory.get(self.service, self.model_name(), PROMPT_VERSION, text)
+
+    def remember_batch(self, backend, lines, translations, latency):
+        # 模型原样返回原文的结果不缓存; 译文记在实际使用的服务名下, 耗时按条数平摊
+        if self.memory is None:
+            return
+        latency /= max(1, len(lines))
+        for text, translation in zip(lines, translations):
+            if not translation or translation.strip() == " ".join(text.split()):
+                continue
+            self.memory.put(
+                backend.name, backend.model, PROMPT_VERSION, text, translation, latency
+            )
+
+    def call_service(self, lines):
+        # 按实际使用的服务编码请求, 返回 (服务, 响应文本)
+        return self.backend.call(
+            lambda backend: backend.translate(
+                self.encode_batch(lines, backend.structured)
+            )
+        )
+
+    async def acall_service(self, lines):
+        return await self.backend.acall(
+            lambda backend: backend.atranslate(
+                self.encode_batch(lines, backend.structured)
+            )
+        )
 
     def get_prompt(self, text):
         # _prompt = """
@@ -112,83 +494,13 @@ class Translator:
         # 我的原文是:
         # """
         _prompt = """
-        你是一位精通英语和中文的翻译专家,帮我把英文翻译成中文:
+        你是一位精通英语和中文的翻译专家,帮我把下面编号的英文字幕逐行翻译成中文.
+        每行输出"编号.译文",编号和行数与原文保持一致,不要输出其他内容:
         """
         prompt = "\n".join(_prompt.split("\n")).replace(" ", "")
         prompt += text
         return prompt
 
-    def kimi_translate(self, text):
-        kimi_client = OpenAI(
-            api_key=self.config.get("KIMI_API_KEY"),
-            base_url=self.config.get("KIMI_BASE_URL"),
-        )
-        kimi_model = self.config.get("KIMI_MODEL", 'moonshot-v1-8k')
-        prompt = self.get_prompt(text=text)
-        try:
-            response = kimi_client.chat.completions.create(
-                messages=[
-                    {"role": "user", "content": prompt},
-                ],
-                model=kimi_model,
-            )
-            content = response.choices[0].message.content
-            translation = content.strip() if content else text.strip()
-            time.sleep(1)
-        except Exception as e:
-            print(f"翻译出错: {e}")
-            time.sleep(1)
-            translation = text
-        return translation
-
-    def deepseek_translate(self, text):
-        deepseek_client = OpenAI(
-            api_key=self.config.get("DEEPSEEK_API_KEY"),
-            base_url=self.config.get("DEEPSEEK_BASE_URL"),
-        )
-        deepseek_model = self.config.get("DEEPSEEK_MODEL", 'deepseek-chat')
-        prompt = self.get_prompt(text=text)
-        try:
-            response = deepseek_client.chat.completions.create(
-                messages=[
-                    {"role": "user", "content": prompt},
-                ],
-                model=deepseek_model,
-            )
-            content = response.choices[0].message.content
-            translation = content.strip() if content else text.strip()
-            time.sleep(1)
-        except Exception as e:
-            print(f"翻译出错: {e}")
-            time.sleep(1)
-            translation = text
-        return translation
-
-    def local_translate(self, text):
-        local_client = OpenAI(
-            api_key='anything',
-            base_url="http://localhost:3040/v1/",
-        )
-        local_model = "gpt-3.5-turbo"
-        # openai.api_key = 'anything'
-        # openai.base_url = "http://localhost:3040/v1/"
-        prompt = self.get_prompt(text=text)
-        try:
-            response = local_client.chat.completions.create(
-                messages=[
-                    {"role": "user", "content": prompt},
-                ],
-                model=local_model,
-            )
-            content = response.choices[0].message.content
-            translation = content.strip() if content else text.strip()
-            time.sleep(0.5)
-        except Exception as e:
-            print(f"翻译出错: {e}")
-            time.sleep(10)
-            translation = text
-        return translation
-
 
 if __name__ == "__main__":
     input_dir = "/home/amaozhao/workspace/ai-videos/test"
@@ -1,111 +1,241 @@
 import asyncio
+import io
 import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
 
 import edge_tts
-import srt
+import numpy as np
 from pydub import AudioSegment
+from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential
+
+from .track import SubtitleTrack
+
+
+# MPEG Layer III 帧头里的比特率 (kbps) 和采样率表, 下标为 MPEG 版本位
+MP3_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_frames(data):
+    """去掉 ID3v2 标签, 数出 MP3 数据里的帧, 返回 (帧数据, 解码后的采样数).
+
+    无法识别的数据返回采样数 None, 由调用方改为单独解码.
+    """
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = int.from_bytes(bytes(b & 0x7F for b in data[6:10]), "big")
+        data = data[10 + size:]
+    samples, offset = 0, 0
+    while offset + 4 <= len(data):
+        b1, b2 = data[offset + 1], data[offset + 2]
+        if data[offset] != 0xFF or b1 & 0xE0 != 0xE0 or (b1 >> 1) & 3 != 1:
+            return data, None
+        version = (b1 >> 3) & 3
+        if version == 1 or b2 >> 4 in (0, 15) or (b2 >> 2) & 3 == 3:
+            return data, None
+        bitrate = MP3_BITRATES[version][b2 >> 4] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][(b2 >> 2) & 3]
+        frame_samples = 1152 if version == 3 else 576
+        offset += frame_samples // 8 * bitrate // sample_rate + ((b2 >> 1) & 1)
+        samples += frame_samples
+    return data, samples
+
+
+class ClipStore:
+    """按字幕下标保存合成的 MP3 数据.
+
+    超过 limit 字节后, 后面的片段写到本任务私有的临时目录, close 时一并删除;
+    解码完的片段用 release 提前释放.
+    """
+
+    def __init__(self, count, limit):
+        self.clips = [None] * count
+        self.limit = limit
+        self.in_memory = 0
+        self.temp_dir = None
+
+    def __len__(self):
+        return len(self.clips)
+
+    def put(self, idx, data):
+        if self.in_memory + len(data) <= self.limit:
+            self.clips[idx] = data
+            self.in_memory += len(data)
+            return
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="tts-")
+        path = os.path.join(self.temp_dir, f"{idx}.mp3")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.clips[idx] = path
+
+    def get(self, idx):
+        clip = self.clips[idx]
+        if isinstance(clip, str):
+            with open(clip, "rb") as f:
+                return f.read()
+        return clip
+
+    def release(self, idx):
+        # 解码完的片段立即释放: 内存里的数据交给 GC, 临时文件直接删除
+        clip, self.clips[idx] = self.clips[idx], None
+        if isinstance(clip, str):
+            os.remove(clip)
+        elif clip is not None:
+            self.in_memory -= len(clip)
+
+    def close(self):
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
 
 
 class TTSConverter:
-    def __init__(self):
-        self.temp_dir = Path("./tmp")
+    def __init__(self, concurrency=8, retries=3, memory_limit_mb=256):
         # self.voice = "zh-CN-YunxiNeural"
         self.voice = "zh-CN-YunyangNeural"
+        # edge-tts 输出 24kHz 单声道, 时间线使用相同的采样率
+        self.frame_rate = 24000
+        # 同一文件的字幕在一个事件循环里并发合成, 同时进行的请求数不超过 concurrency
+        self.concurrency = max(1, concurrency)
+        self.retries = max(1, retries)
+        # 合成的音频先放在内存里, 超过上限才写到临时目录;
+        # 解码时也按这个上限分组, 每次只读入并拼接一组 MP3
+        self.memory_limit = memory_limit_mb * 1024 * 1024
 
     def run(self, input_dir, output_dir):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
-        # 确保输出目录存在
-        os.makedirs(self.temp_dir, exist_ok=True)
         for dirpath, dirnames, filenames in os.walk(self.input_dir):
             rel_path = os.path.relpath(dirpath, self.input_dir)
             output_path = os.path.join(self.output_dir, rel_path)
+            # 确保输出目录存在
             os.makedirs(output_path, exist_ok=True)
 
             for filename in filenames:
                 if filename.endswith(".srt"):
                     self.convert_srt(dirpath, output_path, filename)
 
-        # 清理临时文件
-        for temp_file in self.temp_dir.glob("*.mp3"):
-            temp_file.unlink()
-
     def convert_srt(self, dirpath, output_path, filename):
         input_file = os.path.join(dirpath, filename)
         output_filename = os.path.splitext(filename)[0] + ".mp3"
         output_file = os.path.join(output_path, output_filename)
 
-        with open(input_file, "r", encoding="utf-8") as f:
-            subs = list(srt.parse(f.read()))
+        track = SubtitleTrack.read(input_file)
+
+        store = ClipStore(len(track), self.memory_limit)
+        try:
+            started = time.perf_counter()
+            asyncio.run(self.convert_subs(track, store))
+            elapsed = time.perf_counter() - started
+            print(
+                f"tts: {input_file}: {len(track)} cues in {elapsed:.1f}s "
+                f"({len(track) / elapsed if elapsed else 0.0:.1f} cues/s)"
+            )
+            self.contact_mp3(track, store, output_file)
+        finally:
+            store.close()
+
+    async def convert_subs(self, track, store):
+        semaphore = asyncio.Semaphore(self.concurrency)
 
-        for idx, sub in enumerate(subs):
-            asyncio.run(self.convert_sub(idx, sub))
+        async def convert(idx, content):
+            async with semaphore:
+                store.put(idx, await self.convert_sub(content))
 
-        self.contact_mp3(subs, output_file)
+        await asyncio.gather(
+            *(convert(idx, content) for idx, content in enumerate(track.content))
+        )
 
-    async def convert_sub(self, idx, subtitle):
-        content = subtitle.content
+    async def convert_sub(self, content):
         if len(content.split('\n')) > 1:
             content = content.split('\n')[0]
-        communicate = edge_tts.Communicate(content, self.voice)
-        output_file = os.path.join(self.temp_dir, f"{idx}.mp3")
-        await communicate.save(output_file)
-
-    def contact_mp3(self, subs, output_file):
-        mp3_files = []
-        for dirpath, _, filenames in os.walk(self.temp_dir):
-            rel_path = os.path.relpath(dirpath, self.input_dir)
-            for filename in filenames:
-                if filename.endswith(".mp3"):
-                    print(dirpath, rel_path)
-                    mp3_files.append(os.path.join(dirpath, filename))
-        mp3_files.sort()
-        audios = []
-        for mp3 in mp3_files:
-            audios.append(AudioSegment.from_mp3(mp3))
-
-        sub_audio = AudioSegment.silent(duration=0)
-
-        for i, audio in enumerate(audios):
-            # 对应的字幕
-            sub = subs[i]
-            # 获取原始音频的长度(以毫秒为单位)
-            audio_length = len(audio)
-            sub_start = sub.start
-            sub_end = sub.end
-            # 字幕时间长度(以毫秒为单位)
-            sub_length = int((sub_end - sub_start).total_seconds() * 1000)
-
-            # 判断是否需要压缩
-            if sub_length < audio_length:
-                audio = self.compress_audio(sub_length, audio_length, audio)
-            if i == 0:
-                _silence = int(sub_start.total_seconds()) * 1000
-                sub_audio += self.create_silence(_silence)
-            else:
-                previous_sub = subs[i - 1]
-                previous_end = previous_sub.end
-                _silence = int((sub.start - previous_end).total_seconds() * 1000)
-                sub_audio += self.create_silence(_silence)
-                sub_audio += audio
-        sub_audio.export(output_file, format="mp3")
-
-    def compress_audio(self, sub_length, audio_length, audio):
-        if sub_length < audio_length:
-            # 计算新的播放速率
-            new_rate = audio_length / sub_length
-
-            # 通过调整播放速率来压缩音频
-            audio = audio._spawn(
-                audio.raw_data,
-                overrides={"frame_rate": int(audio.frame_rate * new_rate)},
+        # 网络抖动或服务端断开时带退避重试
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.retries),
+            wait=wait_random_exponential(multiplier=0.5, max=10),
+            reraise=True,
+        ):
+            with attempt:
+                audio = bytearray()
+                communicate = edge_tts.Communicate(content, self.voice)
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        audio += chunk["data"]
+        return bytes(audio)
+
+    def contact_mp3(self, track, store, output_file):
+        self.render_timeline(track, self.decode_clips(store)).export(
+            output_file, format="mp3"
+        )
+
+    def decode_clips(self, store):
+        # 按 memory_limit 分组读回片段, 逐组解码后依次产出每段的采样;
+        # 同一时刻只持有一组的 MP3 和 PCM, 峰值内存不随字幕条数增长 (时间线本身除外)
+        group, size = [], 0
+        for idx in range(len(store)):
+            data, samples = mp3_frames(store.get(idx))
+            group.append((data, samples))
+            size += len(data)
+            if size >= self.memory_limit or idx == len(store) - 1:
+                clips = self.decode_group(group)
+                for released in range(idx - len(group) + 1, idx + 1):
+                    store.release(released)
+                group, size = [], 0
+                yield from clips
+
+    def decode_group(self, frames):
+        # 一组片段拼成一条 MP3 流只解码一次, 再按每段的帧数切开;
+        # 帧数对不上 (采样率不同或数据无法识别) 时退回逐段解码
+        counts = [samples for _, samples in frames]
+        if None not in counts:
+            audio = AudioSegment.from_file(
+                io.BytesIO(b"".join(data for data, _ in frames)), format="mp3"
             )
-        return audio
-
-    def create_silence(self, duration):
-        silence = AudioSegment.silent(duration=duration)
-        return silence
+            if audio.frame_rate == self.frame_rate:
+                samples = self.to_samples(audio)
+                if len(samples) == sum(counts):
+                    return np.split(samples, np.cumsum(counts)[:-1])
+        return [
+            self.to_samples(AudioSegment.from_file(io.BytesIO(data), format="mp3"))
+            for data, _ in frames
+        ]
+
+    def to_samples(self, audio):
+        # 统一成时间线的采样率、单声道、16 位
+        audio = audio.set_channels(1).set_sample_width(2).set_frame_rate(self.frame_rate)
+        return np.frombuffer(audio.raw_data, dtype=np.int16)
+
+    def fit_clip(self, samples, length):
+        # 比字幕时长长的音频按比例加速压缩到字幕时长内, 效果与提高播放速率相同
+        if len(samples) <= length:
+            return samples
+        positions = np.linspace(0, len(samples) - 1, length)
+        return np.interp(positions, np.arange(len(samples)), samples)
+
+    def render_timeline(self, track, clips):
+        # 按最后一条字幕的结束时间一次分配整条 PCM 缓冲区, 每段音频写到字幕起点对应的位置;
+        # clips 可以是按字幕顺序产出的迭代器, 写完一段就可以释放一段
+        total = int(track.end.max()) * self.frame_rate // 1000 if len(track) else 0
+        mix = np.zeros(total, dtype=np.int32)
+        starts = (track.start * self.frame_rate // 1000).tolist()
+        lengths = (track.durations() * self.frame_rate // 1000).tolist()
+        for start, length, clip in zip(starts, lengths, clips):
+            if length <= 0 or start >= total:
+                continue
+            clip = self.fit_clip(clip, length)
+            end = min(start + len(clip), total)
+            mix[start:end] += clip[: end - start].astype(np.int32)
+        pcm = np.clip(mix, -32768, 32767).astype(np.int16)
+        return AudioSegment(
+            pcm.tobytes(), sample_width=2, frame_rate=self.frame_rate, channels=1
+        )
 
 
 if __name__ == "__main__":